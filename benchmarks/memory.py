@@ -0,0 +1,73 @@
+# Memory benchmark
+#
+# Usage: python benchmarks/memory.py [years]
+# Builds a synthetic journal (10 years by default) the way the sheet returns it, and compares the memory of
+# the plain DataFrame, with the metrics made numeric like before, against the compact journal from int_columns.
+
+import os, pickle, sys, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from report_functions import int_columns, prepare_report
+from synthetic import METRICS, get_sheet_rows
+
+
+def plain_columns(df):
+    """
+    In:
+        df: Rows of the sheet (Pandas DataFrame)
+    Does: Makes the metrics numeric and keeps the rest as text, like the loader did before the compact journal.
+    Returns:
+        The journal (Pandas DataFrame)
+    """
+
+    df = df.copy()
+    for column in df.columns:
+        if column not in ['Day', 'Date', 'Journal']:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
+
+def measure(load, rows):
+    """
+    In:
+        load: Makes the journal from the rows (function)
+        rows: Rows of the sheet (Pandas DataFrame)
+    Returns:
+        Resident bytes of the journal, peak bytes allocated while loading, and bytes of its pickle (tuple)
+    """
+
+    tracemalloc.start()
+    df = load(rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return int(df.memory_usage(deep=True).sum()), peak, len(pickle.dumps(df))
+
+
+def main():
+    """
+    Does: Prints the memory of both representations and checks that the compact one gives the same report data.
+    Returns:
+        None
+    """
+
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rows = get_sheet_rows(years)
+    print("%d years, %d days, %d metrics" % (years, len(rows), len(METRICS)))
+    results = {"plain": measure(plain_columns, rows), "compact": measure(int_columns, rows)}
+    for name, (resident, peak, pickled) in results.items():
+        print("%-8s %8.2f MB resident  %8.2f MB peak while loading  %8.2f MB pickled" % (name, resident / 1e6, \
+              peak / 1e6, pickled / 1e6))
+    print("compact is %.1fx smaller" % (results["plain"][0] / results["compact"][0]))
+
+    plain, ctx = plain_columns(rows), prepare_report(int_columns(rows))
+    mondays = np.flatnonzero(plain["Day"] == "måndag")
+    assert ctx["iMax"] == len(plain) and np.isin(ctx["major_ticks"], mondays).all()
+    assert [label.split("\n")[0] for label in ctx["xlabels"]] == list(plain["Date"].iloc[ctx["major_ticks"]])
+    assert np.array_equal(plain[METRICS].to_numpy(dtype=float), ctx["data"].to_numpy(dtype=float), equal_nan=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# Pipeline benchmark
+#
+# Usage: python benchmarks/pipeline.py [--years 1 5 20] [--metrics 15 50 200] [--save FILE] [--baseline FILE]
+# Measures every stage of the report on synthetic journals of each size, fed by a fake gspread client:
+#   int_columns          the rows of the sheet made compact
+#   get_journal_df       the whole sheet fetched, without a local copy
+#   get_journal_df sync  the sheet unchanged since the local copy, no rows fetched
+#   get_journal_df append  one more day filled in since the local copy, only the checksums and the last rows fetched
+#   prepare_report       the report context
+#   get_alerts           the outliers, streaks and shifts of every metric for the mail body
+#   plot <function>      every plot of that function in one run, summed
+#   run                  fetch, render every plot and write the message, like journal_report run without SMTP,
+#                        with the default correlations, 10 compared pairs and 3 windows
+# The fast stages take the best of --repeat runs, the plots and the run the best of --run-repeat runs.
+# --save writes the results as JSON. --baseline compares with saved results and exits with 1 when a stage
+# is more than --tolerance slower, and at least 50 ms, so it can gate a change.
+
+import argparse, json, os, platform, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use("Agg")
+import pandas as pd
+from report_functions import int_columns, get_journal_df, get_cache_file, prepare_report, get_alerts, \
+                             open_render_cache, close_render_cache, get_report_jobs, run_plot_jobs
+from report_mail import write_report_message
+from report_timing import pop_timings
+from synthetic import GROUPS, FakeClient, get_sheet_rows
+
+# Slowdown below this many seconds is noise, not a regression
+MIN_REGRESSION = 0.05
+
+# Days after the last entry of the synthetic journals, the append stage fills in one per run
+FUTURE_DAYS = 14
+
+
+def best_of(function, repeat, setup=None):
+    """
+    In:
+        function: Stage to time, called without arguments (function)
+        repeat: Number of runs (int)
+        setup: Called without arguments before every run, not timed (function)
+    Returns:
+        Seconds of the fastest run (float)
+    """
+
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_report(gc, folder, workers):
+    """
+    In:
+        gc: Fake client with the journal (FakeClient)
+        folder: Empty folder for the cache and the plots (str)
+        workers: Processes to render in (int)
+    Does: Runs the report like journal_report run, with every plot rendered and the message written but not sent.
+    Returns:
+        None
+    """
+
+    df = get_journal_df(None, None, "Journal", cache_path=folder, gc=gc)
+    ctx = prepare_report(df, get_cache_file(folder, "Journal", 1, "stats"), "email", GROUPS)
+    open_render_cache(ctx, folder)
+    jobs = get_report_jobs(folder, GROUPS, ctx, compare=10, windows=(7, 30, 90))
+    images = run_plot_jobs(jobs, ctx, workers)
+    close_render_cache(ctx)
+    with write_report_message("bot@example.com", "me@example.com", "Good morning", "Body", images):
+        pass
+
+
+def append_day(gc, row):
+    """
+    In:
+        gc: Fake client with the journal (FakeClient)
+        row: One of the future rows that only have Day and Date, 0 is the first row after the header (int)
+    Does: Fills in the journal text and every metric of the row, like writing the entry of a new day.
+    Returns:
+        None
+    """
+
+    worksheet = gc.spreadsheet.sheet1
+    rows = worksheet.rows.copy()
+    rows.loc[row, "Journal"] = worksheet.rows["Journal"].iloc[0]
+    for column in rows.columns[3:]:
+        rows.loc[row, column] = 3
+    worksheet.rows = rows
+
+
+def measure_journal(years, metrics, repeat, workers, run_repeat=1):
+    """
+    In:
+        years: Length of the journal (int)
+        metrics: Number of metric columns (int)
+        repeat: Runs of the fast stages (int)
+        run_repeat: Runs of the whole report, the best of each plot function counts (int)
+        workers: Processes to render in (int)
+    Returns:
+        Seconds per stage (dict)
+    """
+
+    rows = get_sheet_rows(years, metrics, gaps=0.01, future=FUTURE_DAYS)
+    gc = FakeClient(rows)
+    df = int_columns(rows)
+    results = {
+        "int_columns": best_of(lambda: int_columns(rows), repeat),
+        "get_journal_df": best_of(lambda: get_journal_df(None, None, "Journal", gc=gc), repeat),
+    }
+    with tempfile.TemporaryDirectory() as cache_path:
+        get_journal_df(None, None, "Journal", cache_path=cache_path, gc=gc)
+        results["get_journal_df sync"] = best_of(lambda: get_journal_df(None, None, "Journal", cache_path=cache_path, gc=gc), repeat)
+    with tempfile.TemporaryDirectory() as cache_path:
+        appended = FakeClient(rows)
+        get_journal_df(None, None, "Journal", cache_path=cache_path, gc=appended)
+        day = iter(range(len(rows) - FUTURE_DAYS, len(rows)))
+        results["get_journal_df append"] = best_of(lambda: get_journal_df(None, None, "Journal", cache_path=cache_path, \
+                                                   gc=appended), min(repeat, FUTURE_DAYS), lambda: append_day(appended, next(day)))
+    results["prepare_report"] = best_of(lambda: prepare_report(df), repeat)
+    ctx = prepare_report(df)
+    results["get_alerts"] = best_of(lambda: get_alerts(ctx), repeat)
+
+    plots = {}
+    for _ in range(run_repeat):
+        pop_timings()
+        with tempfile.TemporaryDirectory() as folder:
+            seconds = best_of(lambda: run_report(gc, folder + "/", workers), 1)
+        results["run"] = min(seconds, results.get("run", seconds))
+        run = {}
+        for record in pop_timings():
+            if record["stage"] == "plot":
+                name = "plot " + record["function"]
+                run[name] = run.get(name, 0.0) + record["seconds"]
+        plots = {name: min(t, plots.get(name, t)) for name, t in run.items()}
+    results.update(sorted(plots.items()))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    In:
+        results: Seconds per stage per journal, from this run (dict)
+        baseline: The same from a saved run (dict)
+        tolerance: Allowed slowdown, 0.25 is 25 % (float)
+    Returns:
+        Stages that got slower, as journal, stage, baseline and new seconds (list of tuples)
+    """
+
+    slower = []
+    for journal, stages in results.items():
+        for stage, seconds in stages.items():
+            before = baseline.get(journal, {}).get(stage)
+            if before is not None and seconds > before * (1 + tolerance) and seconds - before > MIN_REGRESSION:
+                slower.append((journal, stage, before, seconds))
+    return slower
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Prints the seconds of every stage for every journal size, and saves or compares them.
+    Returns:
+        None, exits with 1 if a stage is slower than the baseline
+    """
+
+    parser = argparse.ArgumentParser(prog="pipeline", description="Benchmark of the report on synthetic journals.")
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--metrics", type=int, nargs="+", default=[15, 50, 200])
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the fast stages, the best one counts")
+    parser.add_argument("--run-repeat", type=int, default=1, help="runs of the whole report, the best one of every stage counts")
+    parser.add_argument("--workers", type=int, default=1, help="processes to render the run in")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for years in args.years:
+        for metrics in args.metrics:
+            journal = "%dy %dm" % (years, metrics)
+            results[journal] = measure_journal(years, metrics, args.repeat, args.workers, args.run_repeat)
+            for stage, seconds in results[journal].items():
+                print("%-9s %-36s %9.3f s" % (journal, stage, seconds))
+            sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "pandas": pd.__version__, "matplotlib": matplotlib.__version__,
+                       "workers": args.workers, "results": results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f)["results"], args.tolerance)
+        for journal, stage, before, seconds in slower:
+            print("slower: %s %s %.3f s -> %.3f s" % (journal, stage, before, seconds))
+        print("%d stages slower than the baseline" % len(slower))
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Output profile benchmark
+#
+# Usage: python benchmarks/profiles.py [years] [profile ...]
+# Renders the daily report of a synthetic journal (1 year by default) once with each output profile,
+# in this process, and prints the render time and the bytes of the images that would be mailed.
+
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use("Agg")
+from report_functions import PROFILES, int_columns, prepare_report, open_render_cache, close_render_cache, \
+                             get_report_jobs, run_plot_jobs
+from synthetic import GROUPS, get_sheet_rows
+
+
+def render_profile(df, profile, attatchment_path):
+    """
+    In:
+        df: All of the data (Pandas DataFrame)
+        profile: Key of PROFILES (str)
+        attatchment_path: Empty folder for the plots (str)
+    Returns:
+        Seconds to render, number of images and their total bytes (tuple)
+    """
+
+    start = time.perf_counter()
+    ctx = prepare_report(df, profile=profile, groups=GROUPS)
+    open_render_cache(ctx, attatchment_path)
+    images = run_plot_jobs(get_report_jobs(attatchment_path, GROUPS, ctx), ctx)
+    close_render_cache(ctx)
+    return time.perf_counter() - start, len(images), sum(os.path.getsize(image) for image in images)
+
+
+def main():
+    """
+    Does: Prints the render time and bytes of every profile.
+    Returns:
+        None
+    """
+
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    profiles = sys.argv[2:] or list(PROFILES)
+    df = int_columns(get_sheet_rows(years))
+    print("%d years, %d days" % (years, len(df)))
+    for profile in profiles:
+        with tempfile.TemporaryDirectory() as attatchment_path:
+            seconds, images, size = render_profile(df, profile, attatchment_path + "/")
+        print("%-8s %6.1f s  %3d images  %8.2f MB" % (profile, seconds, images, size / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Correlation ranking benchmark
+#
+# Usage: python benchmarks/ranking.py [--columns 20 100 500] [--years 3] [--top 40] [--repeat 5]
+# Times the ranking of the correlations on synthetic journals with more and more metric columns: the
+# pandas chain the correlation plot used before, rank_correlations with all pairs, and with the top ones.
+# Checks that the new ranking has the same pairs and values as the old one where the old one kept them.
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from report_functions import int_columns, prepare_report, rank_correlations
+from synthetic import get_sheet_rows
+
+
+def old_rank_correlations(data):
+    """
+    In:
+        data: Numeric data (Pandas DataFrame)
+    Does: Ranks like the correlation plot did before rank_correlations, sorting all n^2 entries. Pairs with
+          the same correlation are dropped as duplicates.
+    Returns:
+        Absolute correlations indexed by column pairs, weakest first (Pandas Series)
+    """
+
+    so = data.corr().abs().unstack().sort_values(kind="quicksort")
+    return so[so != 1].drop_duplicates()
+
+
+def best_of(function, repeat):
+    """
+    In:
+        function: Ranking to time, called without arguments (function)
+        repeat: Number of runs (int)
+    Returns:
+        Seconds of the fastest run (float)
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Prints the seconds of every ranking for every number of columns.
+    Returns:
+        None
+    """
+
+    parser = argparse.ArgumentParser(prog="ranking", description="Benchmark of the correlation ranking.")
+    parser.add_argument("--columns", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--top", type=int, default=40, help="strongest correlations kept by the top ranking")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each ranking, the best one counts")
+    args = parser.parse_args(argv)
+
+    print("%7s %7s  %12s  %12s  %12s" % ("columns", "pairs", "old", "new (all)", "new (top %d)" % args.top))
+    for columns in args.columns:
+        data = prepare_report(int_columns(get_sheet_rows(args.years, columns)))["data"]
+        old, new = old_rank_correlations(data), rank_correlations(data)
+        pairs = {frozenset(pair.split(", ")): value for pair, value in new.items()}
+        assert np.allclose([pairs[frozenset(pair)] for pair in old.index], old.to_numpy(), atol=1e-12)
+        assert rank_correlations(data, args.top).index.equals(new.index[-args.top:])
+        times = [best_of(lambda: old_rank_correlations(data), args.repeat), best_of(lambda: rank_correlations(data), args.repeat), \
+                 best_of(lambda: rank_correlations(data, args.top), args.repeat)]
+        print("%7d %7d  %s" % (columns, len(new), "  ".join("%9.1f ms" % (t * 1000) for t in times)))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Startup benchmark
+#
+# Usage: python benchmarks/startup.py
+# Runs each journal_report command for real in a new interpreter with python -X importtime, on a small
+# synthetic journal from a fake gspread client and with a fake SMTP server, then checks sys.modules and
+# fails if a command loaded a library it doesn't need.
+
+import json, os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Commands in the order they run, render uses the local copy of fetch and send the images of render
+COMMANDS = ["fetch", "render", "send", "run"]
+
+# Libraries each command must not load
+FORBIDDEN = {
+    "fetch": ["matplotlib", "scipy", "smtplib", "email.mime", "imapclient"],
+    "render": ["smtplib", "email.mime", "imapclient"],
+    "send": ["pandas", "numpy", "matplotlib", "scipy", "gspread", "oauth2client", "imapclient"],
+    "run": ["imapclient"],
+}
+
+# Stand-in for the user's config.py, with the plots and the local copy in the benchmark's folder
+CONFIG = """password = creds_path = scope = None
+receiver_email = bot_mail = "bot@example.com"
+sheet = "Journal"
+attatchment_path = %r
+"""
+
+
+class FakeSMTP:
+    """
+    Logged in connection for send_report that accepts every message and throws it away.
+    """
+
+    def __init__(self):
+        self.sock = self
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, sender):
+        return 250, b"OK"
+
+    def rcpt(self, recipient):
+        return 250, b"OK"
+
+    def docmd(self, command):
+        return 354, b"Go ahead"
+
+    def sendall(self, data):
+        pass
+
+    def getreply(self):
+        return 250, b"OK"
+
+    def quit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.quit()
+
+
+def run_command(command, folder):
+    """
+    In:
+        command: One of COMMANDS (str)
+        folder: Folder with the config module, the plots and the local copy (str)
+    Does: Runs the command like python -m journal_report, with the Google and SMTP logins replaced. The
+          stand-ins are only installed in the modules the command imports anyway.
+    Returns:
+        Names of the loaded modules (list)
+    """
+
+    import journal_report
+    journal_report.cache_path = os.path.join(folder, "cache") + "/"
+    journal_report.workers = 1 # Every library is loaded in this process
+    if command in ("fetch", "render", "run"):
+        import report_functions
+        from synthetic import FakeClient, get_sheet_rows
+        rows = get_sheet_rows(0.2)
+
+        def get_client(creds_path, scope):
+            import gspread, oauth2client.service_account # The libraries the real client loads
+            return FakeClient(rows)
+
+        report_functions.get_client = get_client
+    if command in ("send", "run"):
+        import report_mail
+        report_mail.open_smtp = lambda *args, **kwargs: FakeSMTP()
+    journal_report.run_command(command)
+    return sorted(sys.modules)
+
+
+def measure_command(command, folder):
+    """
+    In:
+        command: One of COMMANDS (str)
+        folder: Folder with the config module, the plots and the local copy (str)
+    Does: Runs the command in a new interpreter with -X importtime.
+    Returns:
+        Cumulative import time in microseconds of every top level module (dict), and the names of all
+        loaded modules (list)
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "benchmarks"), folder]))
+    result = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__), "--run", command, folder], \
+                            env=env, cwd=folder, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(command + " failed:\n" + result.stderr[-2000:])
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):
+            times[name.strip()] = int(cumulative)
+    return times, json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    """
+    Does: Prints the import time of every command and exits with 1 if one loads a forbidden library.
+    Returns:
+        None
+    """
+
+    import tempfile
+    failed = False
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, "config.py"), "w") as f:
+            f.write(CONFIG % (folder + "/"))
+        for command in COMMANDS:
+            times, modules = measure_command(command, folder)
+            loaded = [name for name in FORBIDDEN[command] if any(m == name or m.startswith(name + ".") for m in modules)]
+            print("%-7s %7.1f ms  %4d modules  %s" % (command, sum(times.values()) / 1000, len(modules), \
+                  "loads " + ", ".join(loaded) if loaded else "ok"))
+            failed = failed or bool(loaded)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        modules = run_command(*sys.argv[2:4])
+        print(json.dumps(modules))
+    else:
+        main()
@@ -0,0 +1,238 @@
+# Synthetic journal
+#
+# Usage: from synthetic import get_sheet_rows, FakeClient
+# Makes deterministic journals with the shape of the real sheet, and a stand-in for the gspread client
+# that serves them, so the whole pipeline can be measured without Google credentials.
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+DAYS = ["måndag", "tisdag", "onsdag", "torsdag", "fredag", "lördag", "söndag"]
+METRICS = ["Average", "Experience", "Harmony", "Social", "Motivation", "Physique", "Creativity", "ER", "Diet", \
+           "Discipline", "Sleep", "Productivity", "Meditation", "Training&Strech", "Insight"]
+WORDS = ["bra", "dag", "tränade", "sov", "jobbade", "läste", "trött", "glad", "middag", "promenad"]
+
+# Groups of the synthetic journal, the same as journal_report.py
+GROUPS = {"Development": ["Discipline", "Productivity", "Creativity", "Insight", "Motivation"],
+          "Health": ["Sleep", "Training&Strech", "Diet", "Physique"],
+          "Happiness": ["Harmony", "Social", "ER", "Experience"]}
+
+
+def get_metrics(metrics):
+    """
+    In:
+        metrics: Number of metric columns (int)
+    Returns:
+        Names of the metrics, the ones of the real sheet first and then Metric 16 and on (list)
+    """
+
+    return METRICS[:metrics] + ["Metric " + str(i + 1) for i in range(len(METRICS), metrics)]
+
+
+def get_sheet_rows(years, metrics=len(METRICS), seed=0, gaps=0.0, blanks=0.03, future=0):
+    """
+    In:
+        years: Length of the journal (int)
+        metrics: Number of metric columns, see get_metrics (int)
+        seed: Seed of the random values (int)
+        gaps: Share of the days without an entry, their text and metrics are blank (float)
+        blanks: Share of the metric cells left blank on the other days (float)
+        future: Days after the last entry that only have Day and Date filled in, like the sheet (int)
+    Does: Makes one row per day like get_all_records: weekday names, date strings, a few hundred characters
+          of journal text, and metrics from 1 to 5. The same arguments always give the same rows.
+    Returns:
+        Rows of the sheet (Pandas DataFrame)
+    """
+
+    rng = np.random.default_rng(seed)
+    days = int(365.25 * years)
+    dates = [date(2020, 5, 18) + timedelta(days=i) for i in range(days + future)]
+    missed = rng.random(days + future) < gaps
+    missed[days:] = True
+    words = np.array(WORDS)
+    rows = {
+        "Day": [DAYS[d.weekday()] for d in dates],
+        "Date": [d.isoformat() for d in dates],
+        "Journal": ["" if skip else " ".join(words[rng.integers(0, len(words), rng.integers(30, 80))]) for skip in missed],
+    }
+    for metric in get_metrics(metrics):
+        values = rng.integers(1, 6, days + future).astype(object)
+        values[missed | (rng.random(days + future) < blanks)] = ""
+        rows[metric] = values
+    return pd.DataFrame(rows)
+
+
+def get_api_error(code, message):
+    """
+    In:
+        code: HTTP status of the error (int)
+        message: Message of the error (str)
+    Returns:
+        The error gspread raises for a failed request (gspread APIError)
+    """
+
+    from types import SimpleNamespace
+    import gspread
+    error = {"code": code, "message": message, "status": "PERMISSION_DENIED"}
+    return gspread.exceptions.APIError(SimpleNamespace(json=lambda: {"error": error}, text=message))
+
+
+class FakeWorksheet:
+    """
+    Worksheet with the calls sync_journal_df and get_journal_df make, answered from the rows. Values come
+    back as the strings the API sends, with the blank cells at the end of a row left out. Counts the cells
+    it sends in cells. Edit it with edit or by setting rows, which moves the modified time of the spreadsheet.
+    """
+
+    def __init__(self, rows, spreadsheet=None, title="Journal"):
+        self._rows = rows
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.cells = 0
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows):
+        self._rows = rows
+        if self.spreadsheet is not None:
+            self.spreadsheet.version += 1
+            if self.spreadsheet.checksums is not None:
+                self.spreadsheet.checksums.recalculate()
+
+    @property
+    def row_count(self):
+        return len(self.rows) + 1
+
+    def edit(self, row, column, value):
+        # Row 0 is the first row after the header
+        rows = self.rows.copy()
+        rows.loc[row, column] = value
+        self.rows = rows
+
+    def values(self, first):
+        values = []
+        for row in self.rows.iloc[first:].astype(str).itertuples(index=False):
+            row = list(row)
+            while row and row[-1] == "":
+                row.pop()
+            values.append(row)
+        self.cells += sum(len(row) for row in values)
+        return values
+
+    def row_values(self, row):
+        return list(self.rows.columns) if row == 1 else self.values(row - 2)[0]
+
+    def get(self, cells, major_dimension=None, value_render_option=None):
+        # Only the open ended A<first>:<last column> ranges of sync_journal_df
+        return self.values(int(cells.split(":")[0][1:]) - 2)
+
+    def get_all_records(self):
+        from report_functions import get_record_values
+        header = list(self.rows.columns)
+        return [dict(zip(header, get_record_values(row, header))) for row in self.values(0)]
+
+
+class FakeChecksumWorksheet:
+    """
+    Worksheet of set_checksum_formula that computes the checksums of the journal rows in A1 like the
+    sheet would, when the formula or the journal changes rather than when they are read. The formula
+    fills as many rows as the worksheet has, the rest come back as #REF!. Counts the cells it sends in cells.
+    """
+
+    def __init__(self, journal, title, rows):
+        self.journal = journal
+        self.title = title
+        self.row_count = rows
+        self.formula = None
+        self.checksums = []
+        self.hidden = False
+        self.cells = 0
+
+    def hide(self):
+        self.hidden = True
+
+    def resize(self, rows=None, cols=None):
+        self.row_count = rows or self.row_count
+        self.recalculate()
+
+    def update_acell(self, label, value):
+        if not self.journal.spreadsheet.write:
+            raise get_api_error(403, "The caller does not have permission")
+        self.formula = value
+        self.recalculate()
+
+    def recalculate(self):
+        from report_functions import get_checksum_formula, get_checksum_weights
+        rows = self.journal.rows
+        if self.formula != get_checksum_formula(self.journal.title, list(rows.columns)):
+            self.checksums = ["#REF!"] * len(rows)
+            return
+        text = rows.astype(str)
+        checksums = sum(text[column].map(lambda cell: len(cell.encode("utf-16-le")) // 2) for column in text)
+        for column, weight in zip(rows.columns, get_checksum_weights(list(rows.columns))):
+            if weight:
+                checksums = checksums + weight * pd.to_numeric(rows[column], errors="coerce").fillna(0)
+        checksums = list(checksums.astype(float))
+        self.checksums = checksums if self.row_count >= len(checksums) else ["#REF!"] * len(checksums)
+
+    def get(self, cells, major_dimension=None, value_render_option=None):
+        # Only the A1:A<last row> column of get_sheet_checksums
+        values = self.checksums[:int(cells.split(":")[1][1:])]
+        self.cells += len(values)
+        return [values]
+
+
+class FakeSpreadsheet:
+    """
+    Spreadsheet whose modified time changes with every edit of the rows. Without drive the modified time
+    fails like for a client without the Drive scope, and without write the checksum worksheet can't be
+    added, like for a read only scope.
+    """
+
+    def __init__(self, rows, drive=True, write=True):
+        self.version = 0
+        self.drive = drive
+        self.write = write
+        self.sheet1 = FakeWorksheet(rows, self)
+        self.checksums = None
+
+    def get_worksheet(self, index):
+        return self.sheet1
+
+    def worksheets(self, exclude_hidden=False):
+        return [self.sheet1] + ([self.checksums] if self.checksums is not None else [])
+
+    def worksheet(self, title):
+        import gspread
+        for sheet in self.worksheets():
+            if sheet.title == title:
+                return sheet
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        if not self.write:
+            raise get_api_error(403, "The caller does not have permission")
+        self.checksums = FakeChecksumWorksheet(self.sheet1, title, rows)
+        return self.checksums
+
+    def get_lastUpdateTime(self):
+        if not self.drive:
+            raise get_api_error(403, "Request had insufficient authentication scopes.")
+        return str(self.version)
+
+
+class FakeClient:
+    """
+    Client for get_journal_df(gc=...) that opens every sheet name as the same rows, see FakeSpreadsheet.
+    """
+
+    def __init__(self, rows, drive=True, write=True):
+        self.spreadsheet = FakeSpreadsheet(rows, drive, write)
+
+    def open(self, sheet):
+        return self.spreadsheet
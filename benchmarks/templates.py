@@ -0,0 +1,133 @@
+# Plot template benchmark
+#
+# Usage: python benchmarks/templates.py [--years 3] [--plots 50] [--profile archive] [--tracemalloc]
+# Renders the data, group and compare plots of a synthetic journal, 50 by default, in this process once
+# reusing the plot templates and once building a new figure for every plot, each in a new interpreter.
+# Prints the seconds, the figures left open, the peak RSS and, with --tracemalloc, the peak of the Python
+# allocations of each, and checks that both give the same pixels.
+
+import argparse, json, os, resource, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ["templates", "fresh"]
+
+
+def get_jobs(attatchment_path, ctx, plots):
+    """
+    In:
+        attatchment_path: Folder for the plots (str)
+        ctx: Report context from prepare_report (dict)
+        plots: Number of plots (int)
+    Returns:
+        Jobs of every data and group plot, then compare plots of the most correlated pairs up to plots (list of tuples)
+    """
+
+    from report_functions import create_data_plot, create_group_plot, get_compare_jobs
+    from synthetic import GROUPS
+    jobs = [(create_data_plot, (column, attatchment_path), {}) for column in ctx["data"]] \
+         + [(create_group_plot, (attatchment_path, group, GROUPS, False), {}) for group in GROUPS]
+    return jobs[:plots] if plots <= len(jobs) else jobs + get_compare_jobs(attatchment_path, ctx, plots - len(jobs))
+
+
+def render(mode, years, plots, profile, folder, trace):
+    """
+    In:
+        mode: One of MODES (str)
+        years: Length of the journal (int)
+        plots: Number of plots (int)
+        profile: Output profile of the plots (str)
+        folder: Empty folder for the plots (str)
+        trace: Measures the Python allocations with tracemalloc, which slows the render down (bool)
+    Does: Renders the plots one by one in this process. In fresh mode the templates are closed after every
+          plot, so each plot builds its figure like before the templates.
+    Returns:
+        Seconds, figures open at the end, peak RSS in bytes and peak of tracemalloc in bytes or None (dict)
+    """
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import tracemalloc
+    from matplotlib import pyplot as plt
+    from report_functions import int_columns, prepare_report, close_plot_templates, _run_plot_job
+    from synthetic import GROUPS, get_sheet_rows
+
+    ctx = prepare_report(int_columns(get_sheet_rows(years)), profile=profile, groups=GROUPS)
+    jobs = get_jobs(folder + "/", ctx, plots)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for job in jobs:
+        _run_plot_job(job, ctx)
+        if mode == "fresh":
+            close_plot_templates()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"seconds": seconds, "plots": len(jobs), "figures": len(plt.get_fignums()), "rss": rss, "traced": peak}
+
+
+def get_pixels(folder):
+    """
+    In:
+        folder: Folder with the plots (str)
+    Returns:
+        Pixels of every image by its path in the folder (dict)
+    """
+
+    import numpy as np
+    from PIL import Image
+    pixels = {}
+    for path, _, files in os.walk(folder):
+        for name in files:
+            pixels[os.path.relpath(os.path.join(path, name), folder)] = np.asarray(Image.open(os.path.join(path, name)))
+    return pixels
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Prints the measurements of both modes and exits with 1 if their images differ.
+    Returns:
+        None
+    """
+
+    parser = argparse.ArgumentParser(prog="templates", description="Benchmark of the plot templates.")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--plots", type=int, default=50)
+    parser.add_argument("--profile", default="archive", help="output profile of the plots")
+    parser.add_argument("--tracemalloc", action="store_true", help="also measure the peak of the Python allocations")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(render(args.mode, args.years, args.plots, args.profile, args.folder, args.tracemalloc)))
+        return
+
+    import numpy as np
+    with tempfile.TemporaryDirectory() as folder:
+        pixels = {}
+        for mode in MODES:
+            os.makedirs(os.path.join(folder, mode))
+            command = [sys.executable, os.path.abspath(__file__), "--mode", mode, "--folder", os.path.join(folder, mode), \
+                       "--years", str(args.years), "--plots", str(args.plots), "--profile", args.profile] \
+                    + (["--tracemalloc"] if args.tracemalloc else [])
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode:
+                raise RuntimeError(mode + " failed:\n" + result.stderr[-2000:])
+            result = json.loads(result.stdout.splitlines()[-1])
+            print("%-9s %d plots %8.1f s  %3d open figures  maxrss %6.0f MB%s" % (mode, result["plots"], result["seconds"], \
+                  result["figures"], result["rss"] / 1e6, "" if result["traced"] is None else \
+                  "  tracemalloc peak %6.1f MB" % (result["traced"] / 1e6)))
+            sys.stdout.flush()
+            pixels[mode] = get_pixels(os.path.join(folder, mode))
+    same = pixels["templates"].keys() == pixels["fresh"].keys() and \
+           all(np.array_equal(image, pixels["fresh"][path]) for path, image in pixels["templates"].items())
+    print("images " + ("identical" if same else "differ"))
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Render worker benchmark
+#
+# Usage: python benchmarks/workers.py [--years 1] [--workers 1 2 4] [--profile archive]
+# Renders every plot of the daily report of a synthetic journal with each number of worker processes,
+# from a new pool each time like journal_report render, and prints the wall time. Checks that every
+# number of workers gives the same images as 1 worker.
+
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use("Agg")
+from report_functions import int_columns, prepare_report, get_report_jobs, run_plot_jobs
+from synthetic import GROUPS, get_sheet_rows
+
+
+def render_workers(ctx, workers, attatchment_path):
+    """
+    In:
+        ctx: Report context from prepare_report (dict)
+        workers: Number of processes to render in, 1 renders in this process (int)
+        attatchment_path: Empty folder for the plots (str)
+    Returns:
+        Seconds to render, and the bytes of every image by its file name (tuple)
+    """
+
+    start = time.perf_counter()
+    images = run_plot_jobs(get_report_jobs(attatchment_path, GROUPS, ctx), ctx, workers)
+    seconds = time.perf_counter() - start
+    files = {}
+    for image in images:
+        with open(image, "rb") as f:
+            files[os.path.relpath(image, attatchment_path)] = f.read()
+    return seconds, files
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Prints the wall time of every number of workers and exits with 1 if the images differ.
+    Returns:
+        None
+    """
+
+    parser = argparse.ArgumentParser(prog="workers", description="Benchmark of rendering in worker processes.")
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--profile", default="archive", help="output profile of the plots")
+    args = parser.parse_args(argv)
+
+    ctx = prepare_report(int_columns(get_sheet_rows(args.years)), profile=args.profile, groups=GROUPS)
+    print("%d CPUs, %d plots" % (os.cpu_count() or 1, len(get_report_jobs("", GROUPS, ctx))))
+    first, same = None, True
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as folder:
+            seconds, files = render_workers(ctx, workers, folder + "/")
+        first = first or files
+        same = same and files == first
+        print("workers=%-3d %8.1f s  %s" % (workers, seconds, "same images" if files == first else "images differ"))
+        sys.stdout.flush()
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Batch journal report file
+#
+# Usage: python -m journal_batch manifest.json [--no-mail]
+# Creates and sends the reports of many journals in one process. They share one authorized
+# gspread client, one render pool and one SMTP connection. The manifest is a JSON list:
+#
+# [
+#     {"name": "alex", "sheet": "Journal 2020", "recipients": ["alex@example.com"],
+#      "groups": {"Health": ["Sleep", "Diet"], "Rest": {"Sleep": 2, "Meditation": 1}}},
+#     {"name": "sam", "sheet": "Sam's journal", "worksheet": 0, "recipients": ["sam@example.com"],
+#      "attatchment_path": "reports/sam/", "top_correlations": 20, "compare_pairs": 10,
+#      "stat_windows": [7, 30, 90], "profile": "archive"}
+# ]
+#
+# name, sheet and recipients are required. A journal that fails is reported and the others continue.
+
+# Import dependencies
+import argparse, json, os, sys, time, threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import password, creds_path, bot_mail, scope
+from journal_report import port, workers, cache_path, profile, get_body
+
+# Journals fetched, rendered and mailed at the same time, the rendering itself is limited by workers
+journal_threads = 4
+
+
+def load_manifest(path):
+    """
+    In:
+        path: Path of the manifest (str)
+    Does: Reads the journals and fills in the optional settings.
+    Returns:
+        Journals (list of dicts)
+    """
+
+    with open(path) as f:
+        journals = json.load(f)
+    names = set()
+    for journal in journals:
+        missing = [key for key in ("name", "sheet", "recipients") if key not in journal]
+        if missing:
+            raise ValueError("Journal " + str(journal.get("name", journal)) + " is missing " + ", ".join(missing))
+        if journal["name"] in names:
+            raise ValueError("Journal " + journal["name"] + " is in the manifest twice")
+        names.add(journal["name"])
+        journal.setdefault("worksheet", 1)
+        journal.setdefault("groups", {})
+        journal.setdefault("attatchment_path", os.path.join("reports", journal["name"], ""))
+        journal.setdefault("top_correlations", None)
+        journal.setdefault("compare_pairs", 0)
+        journal["stat_windows"] = tuple(journal.get("stat_windows", ()))
+        journal.setdefault("profile", profile)
+    return journals
+
+
+def run_journal(journal, gc, pool, mail):
+    """
+    In:
+        journal: One journal from load_manifest (dict)
+        gc: Client from get_client (gspread Client)
+        pool: Shared pool from open_render_pool (ProcessPoolExecutor)
+        mail: Sends the images and the body to the journal's recipients, None to skip (function)
+    Does: Fetches, renders and mails the report of one journal.
+    Returns:
+        Seconds per stage (dict)
+    """
+
+    from report_functions import get_journal_df, get_cache_file, prepare_report, open_render_cache, close_render_cache, get_report_jobs, run_plot_jobs
+
+    times = {}
+    start = time.perf_counter()
+    df = get_journal_df(creds_path, scope, journal["sheet"], cache_path=cache_path, gc=gc, worksheet=journal["worksheet"])
+    times["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    attatchment_path = journal["attatchment_path"]
+    os.makedirs(attatchment_path, exist_ok=True)
+    ctx = prepare_report(df, get_cache_file(cache_path, journal["sheet"], journal["worksheet"], "stats"), journal["profile"],
+                         journal["groups"])
+    open_render_cache(ctx, attatchment_path)
+    jobs = get_report_jobs(attatchment_path, journal["groups"], ctx, journal["top_correlations"],
+                           compare=journal["compare_pairs"], windows=journal["stat_windows"])
+    images = run_plot_jobs(jobs, ctx, pool=pool)
+    close_render_cache(ctx)
+    times["render"] = time.perf_counter() - start
+
+    if mail is not None:
+        start = time.perf_counter()
+        mail(journal, images, get_body(ctx))
+        times["send"] = time.perf_counter() - start
+    return times
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Runs every journal in the manifest and prints the time of each stage per journal.
+    Returns:
+        None, exits with 1 if any journal failed
+    """
+
+    parser = argparse.ArgumentParser(prog="journal_batch", description="Reports for many journals in one process.")
+    parser.add_argument("manifest")
+    parser.add_argument("--no-mail", action="store_true", help="only fetch and render")
+    args = parser.parse_args(argv)
+    journals = load_manifest(args.manifest)
+
+    import ssl, smtplib
+    from report_functions import get_client, open_render_pool
+    from report_mail import write_report_message, open_smtp, send_report
+
+    # One SMTP connection for all journals, opened by the first one to finish
+    smtp = {"server": None}
+    smtp_lock = threading.Lock()
+
+    def mail(journal, images, text):
+        with write_report_message(bot_mail, journal["recipients"], "Good morning", text, images) as message, smtp_lock:
+            if smtp["server"] is None:
+                smtp["server"] = open_smtp("smtp.gmail.com", port, bot_mail, password, ssl.create_default_context())
+            try:
+                send_report(smtp["server"], bot_mail, journal["recipients"], message)
+            except smtplib.SMTPServerDisconnected:
+                smtp["server"] = open_smtp("smtp.gmail.com", port, bot_mail, password, ssl.create_default_context())
+                send_report(smtp["server"], bot_mail, journal["recipients"], message)
+
+    gc = get_client(creds_path, scope)
+    failed = []
+    start = time.perf_counter()
+    with open_render_pool(workers) as pool, ThreadPoolExecutor(max_workers=journal_threads) as threads:
+        futures = [(journal["name"], threads.submit(run_journal, journal, gc, pool, None if args.no_mail else mail)) \
+                   for journal in journals]
+        for name, future in futures:
+            try:
+                times = future.result()
+                print(name + ": " + ", ".join(stage + " %.1f s" % t for stage, t in times.items()))
+            except Exception as error:
+                failed.append(name)
+                print(name + ": failed, " + type(error).__name__ + ": " + str(error))
+    if smtp["server"] is not None:
+        smtp["server"].quit()
+
+    print("%d of %d journals done in %.1f s. " % (len(journals) - len(failed), len(journals), time.perf_counter() - start) \
+          + str(datetime.now()))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
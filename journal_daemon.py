@@ -0,0 +1,284 @@
+# Resident journal report file
+#
+# Usage: python -m journal_daemon [--at 07:00] [--poll 15] [--port 8377] [--mail-on-change] [--no-mail] [--timings FILE]
+# Stays running with the authorized gspread client, the journal, matplotlib and the render workers in memory:
+#   --at    sends the report every day at this time, like the cron job did
+#   --poll  asks Drive every this many seconds if the sheet changed, and renders the report again once
+#           the change has settled for one poll. 0 turns polling off. Needs the Drive scope in config.py,
+#           without it polling is turned off at start
+#   --port  listens on 127.0.0.1 for on-demand runs, 0 turns it off:
+#             curl -X POST localhost:8377/run      render and send now
+#             curl -X POST localhost:8377/render   render now
+#             curl localhost:8377/status           the last runs as JSON
+# The other settings come from journal_report.py. --timings FILE is rewritten after every run.
+
+# Import dependencies
+import argparse, json, queue, threading, time
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from config import creds_path, sheet, scope
+import journal_report
+from report_timing import timed, instrument, write_timings, pop_timings
+
+# Runs kept for /status
+status_runs = 20
+
+
+def get_next_run(at, now=None):
+    """
+    In:
+        at: Time of day as HH:MM (str)
+        now: Time to count from, datetime.now() if None (datetime)
+    Returns:
+        Next time the daily report is due, today if it is still ahead (datetime)
+    """
+
+    now = now or datetime.now()
+    hour, minute = (int(part) for part in at.split(":"))
+    due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return due if due > now else due + timedelta(days=1)
+
+
+def open_journal(gc):
+    """
+    In:
+        gc: Client from get_client (gspread Client)
+    Does: Opens the sheet once, every later fetch and poll reuses it.
+    Returns:
+        Daemon state (dict) with the client, sheet, worksheet, and the journal and its modified time once fetched
+    """
+
+    spreadsheet = gc.open(sheet)
+    return {"gc": gc, "spreadsheet": spreadsheet, "worksheet": spreadsheet.get_worksheet(1),
+            "df": None, "modified": None, "seen": None, "runs": deque(maxlen=status_runs), "lock": threading.Lock()}
+
+
+def get_journal(state):
+    """
+    In:
+        state: Daemon state from open_journal (dict)
+    Does: Fetches the sheet only when it was modified since the last fetch, otherwise the journal in memory
+          is used as it is. Without the modified time from Drive it always syncs with the local copy.
+    Returns:
+        All of the data (Pandas DataFrame)
+    """
+
+    from report_functions import sync_journal_df, get_cache_file, get_modified_time
+    modified = get_modified_time(state["worksheet"])
+    if state["df"] is None or modified is None or modified != state["modified"]:
+        state["df"] = sync_journal_df(state["worksheet"], get_cache_file(journal_report.cache_path, sheet, 1), modified)
+        state["modified"] = modified
+    return state["df"]
+
+
+def poll_journal(state):
+    """
+    In:
+        state: Daemon state from open_journal (dict)
+    Does: Reads the modified time of the sheet from Drive, a small metadata request that downloads no rows.
+          A change is only reported once the time is the same at two polls in a row, so a day that is
+          being typed in is rendered once it is done.
+    Returns:
+        True if the sheet changed since the last fetch and has settled, False without the modified time (bool)
+    """
+
+    from report_functions import get_modified_time
+    modified = get_modified_time(state["worksheet"])
+    if modified is None:
+        return False
+    settled = modified == state["seen"]
+    state["seen"] = modified
+    return settled and modified != state["modified"]
+
+
+def run_report(state, pool, mail):
+    """
+    In:
+        state: Daemon state from open_journal (dict)
+        pool: Running pool from open_render_pool (ProcessPoolExecutor)
+        mail: Sends the report when True (bool)
+    Does: Fetches, renders and sends the report with the warm state, and adds the run to the status.
+    Returns:
+        Seconds per stage (dict)
+    """
+
+    times = {}
+    with timed("fetch") as record:
+        df = get_journal(state)
+    times["fetch"] = record["seconds"]
+    with timed("render") as record:
+        journal_report.render(df, pool)
+    times["render"] = record["seconds"]
+    if mail:
+        with timed("send") as record:
+            journal_report.send()
+        times["send"] = record["seconds"]
+    return times
+
+
+def get_trigger_handler(requests, state):
+    """
+    In:
+        requests: Queue the main loop takes its runs from (queue.Queue)
+        state: Daemon state from open_journal (dict)
+    Returns:
+        Request handler for POST /run, POST /render and GET /status (class)
+    """
+
+    class TriggerHandler(BaseHTTPRequestHandler):
+        def reply(self, code, data):
+            text = json.dumps(data, indent=1, default=str).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(text)))
+            self.end_headers()
+            self.wfile.write(text)
+
+        def do_POST(self):
+            if self.path not in ("/run", "/render"):
+                return self.reply(404, {"error": "use POST /run or /render"})
+            requests.put(self.path[1:])
+            self.reply(202, {"queued": self.path[1:], "waiting": requests.qsize()})
+
+        def do_GET(self):
+            if self.path != "/status":
+                return self.reply(404, {"error": "use GET /status"})
+            with state["lock"]:
+                self.reply(200, {"modified": state["modified"], "next": state.get("next"), "runs": list(state["runs"])})
+
+        def log_message(self, format, *args):
+            pass
+
+    return TriggerHandler
+
+
+def start_trigger_server(port, requests, state):
+    """
+    In:
+        port: Port on 127.0.0.1 (int)
+        requests: Queue the main loop takes its runs from (queue.Queue)
+        state: Daemon state from open_journal (dict)
+    Does: Serves the triggers in a background thread. Only this machine can reach it.
+    Returns:
+        The server, shut it down when done (HTTPServer)
+    """
+
+    server = HTTPServer(("127.0.0.1", port), get_trigger_handler(requests, state))
+    threading.Thread(target=server.serve_forever, name="trigger", daemon=True).start()
+    return server
+
+
+def serve(state, pool, requests, at, poll, mail, mail_on_change=False, timings=None):
+    """
+    In:
+        state: Daemon state from open_journal (dict)
+        pool: Running pool from open_render_pool (ProcessPoolExecutor)
+        requests: Queue of the triggered runs, "run" or "render" (queue.Queue)
+        at: Time of day of the daily report as HH:MM (str)
+        poll: Seconds between the polls of the sheet, 0 never polls (float)
+        mail: Sends the daily and triggered reports when True (bool)
+        mail_on_change: Also sends the reports rendered because the sheet changed (bool)
+        timings: File to write the timings of every run to, see write_timings (str)
+    Does: Waits for the next daily report, poll or trigger, and runs it. A run that fails is reported and
+          the daemon carries on, except when the render workers are gone.
+    Returns:
+        None, runs until interrupted
+    """
+
+    from concurrent.futures.process import BrokenProcessPool
+    state["next"] = get_next_run(at)
+    next_poll = time.monotonic()
+    while True:
+        wait = (state["next"] - datetime.now()).total_seconds()
+        if poll:
+            wait = min(wait, next_poll - time.monotonic())
+        try:
+            reason = requests.get(timeout=max(wait, 0))
+        except queue.Empty:
+            reason = None
+
+        if reason is None and datetime.now() >= state["next"]:
+            reason = "daily"
+            state["next"] = get_next_run(at)
+        elif reason is None:
+            next_poll = time.monotonic() + poll
+            try:
+                if not poll_journal(state):
+                    continue
+            except Exception as error:
+                print("Poll failed, " + type(error).__name__ + ": " + str(error))
+                continue
+            reason = "change"
+
+        send = mail and (reason in ("daily", "run") or (reason == "change" and mail_on_change))
+        run = {"reason": reason, "start": datetime.now()}
+        try:
+            run["seconds"] = run_report(state, pool, send)
+            print(reason + ": " + ", ".join(stage + " %.1f s" % t for stage, t in run["seconds"].items()) \
+                  + ". " + str(datetime.now()))
+        except BrokenProcessPool:
+            raise
+        except Exception as error:
+            run["error"] = type(error).__name__ + ": " + str(error)
+            print(reason + ": failed, " + run["error"])
+        with state["lock"]:
+            state["runs"].append(run)
+        if timings:
+            write_timings(timings)
+        else:
+            pop_timings()
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Warms up the client, the journal and the render workers, then serves the report until interrupted.
+    Returns:
+        None
+    """
+
+    parser = argparse.ArgumentParser(prog="journal_daemon", description="Resident daily statistics report from the journal sheet.")
+    parser.add_argument("--at", default="07:00", help="time of the daily report, HH:MM")
+    parser.add_argument("--poll", type=float, default=15, help="seconds between checks of the sheet for changes, 0 never checks")
+    parser.add_argument("--port", type=int, default=8377, help="port on 127.0.0.1 for on-demand runs, 0 for none")
+    parser.add_argument("--mail-on-change", action="store_true", help="also send the reports rendered because the sheet changed")
+    parser.add_argument("--no-mail", action="store_true", help="only fetch and render")
+    parser.add_argument("--timings", metavar="FILE", help="write the timings of every run, FILE.prom as a Prometheus textfile, else JSON")
+    args = parser.parse_args(argv)
+    get_next_run(args.at) # Fails on a bad --at before the warm-up
+
+    import report_functions, report_mail
+    from matplotlib import pyplot as plt
+    from report_functions import get_client, open_render_pool, get_modified_time
+    if args.timings:
+        instrument(report_functions)
+        instrument(report_mail)
+    plt.switch_backend("Agg")
+    plt.figure().canvas.draw() # Loads the font cache now instead of in the first run
+    plt.close("all")
+
+    state = open_journal(get_client(creds_path, scope))
+    if args.poll and get_modified_time(state["worksheet"]) is None:
+        print("Polling is off, the client can't read the modified time of the sheet. --poll needs the Drive scope in config.py.")
+        args.poll = 0
+    requests = queue.Queue()
+    # Start the workers before the trigger thread, forking from a process with running threads isn't safe
+    with open_render_pool(journal_report.workers) as pool:
+        server = start_trigger_server(args.port, requests, state) if args.port else None
+        times = run_report(state, pool, False)
+        pop_timings()
+        print("Ready: " + ", ".join(stage + " %.1f s" % t for stage, t in times.items()) + ", next report " \
+              + str(get_next_run(args.at)) + ". " + str(datetime.now()))
+        try:
+            serve(state, pool, requests, args.at, args.poll, not args.no_mail, args.mail_on_change, args.timings)
+        except KeyboardInterrupt:
+            print("Stopped. " + str(datetime.now()))
+        finally:
+            if server is not None:
+                server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,272 @@
 # Main journal report file
+#
+# Usage: python -m journal_report [run|fetch|render|send]
+#   run    (default) fetch, render and send the report, with the stages overlapped
+#   fetch  update the local copy of the sheet
+#   render fetch and render the plots
+#   send   mail the plots of the last render
+# Each command imports only the libraries it needs.
+#
+# Options:
+#   --timings FILE  write how long each stage, function and image took, FILE.prom as a Prometheus textfile, else JSON
+#   --profile FILE  write cProfile stats of the main process, read them with python -m pstats FILE
 
-# Import dependencies   
-import smtplib, ssl, email, imapclient, time, csv, gspread, os
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd 
-from datetime import datetime
-from matplotlib import pyplot as plt
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-from report_functions import (get_journal_df, create_all_data_plots, rank_columns_correlation_plot, rank_columns_mean_plot, \
-                         rank_columns_std_plot, create_all_group_plots)
-from config import password, receiver_email, creds_path, attatchment_path, bot_mail, sheet, scope 
-
-# Defining the groups
+# Import dependencies
+import argparse, os, importlib
+from datetime import datetime, date
+from report_timing import timed, instrument, write_timings
+from config import password, receiver_email, creds_path, attatchment_path, bot_mail, sheet, scope
+
+# Defining the groups, a group can also weigh its members like {"Sleep": 2, "Diet": 1}
 groups={"Development":["Discipline", "Productivity", "Creativity", "Insight", "Motivation"], \
         "Health":["Sleep", "Training&Strech", "Diet", "Physique"], \
         "Happiness":["Harmony", "Social", "ER", "Experience"]}
 
 show = False
 send_mail = True
+workers = os.cpu_count() or 1 # Processes used to render the plots
+cache_path = "journal_cache/" # Local copy of the sheet, delete it to fetch everything again
+top_correlations = None # Number of strongest correlations to plot, None plots report_functions.MAX_CORRELATIONS
+compare_pairs = 0 # Number of most correlated pairs to plot side by side, None plots all pairs
+stat_windows = () # Last days to compare with all of history in the mean and std plots, like (7, 30, 90)
+profile = "email" # Output profile of the plots: email, email-png, archive or vector, see report_functions.PROFILES
+report_format = "images" # How the report is mailed: images as attachments, html with the images in the mail, or pdf
+body = "Här är den dagliga statistikrapporten från journalen \n Lycka till idag!" # Email message
+alerts = True # Adds the outliers, streaks and shifts of the metrics below the message, see report_functions.get_alerts
+port = 465
+
+# Modules each command uses, timed with --timings
+command_modules = {"run": ["report_functions", "report_mail"], "fetch": ["report_functions"], \
+                   "render": ["report_functions"], "send": ["report_mail"]}
+
+
+def fetch():
+    """
+    Does: Gets the journal data, only fetching new rows when there is a local copy.
+    Returns:
+        All of the data (Pandas DataFrame)
+    """
+
+    from report_functions import get_journal_df
+    return get_journal_df(creds_path, scope, sheet, cache_path=cache_path)
+
+
+def get_pdf_file():
+    """
+    Returns:
+        Path of today's PDF report, one is kept per day (str)
+    """
+
+    return attatchment_path + "report_" + date.today().isoformat() + ".pdf"
+
+
+def get_body_file():
+    """
+    Returns:
+        Path of the mail body of the last render (str)
+    """
+
+    return attatchment_path + "report_body.txt"
+
+
+def get_body(ctx):
+    """
+    In:
+        ctx: Report context from prepare_report (dict)
+    Returns:
+        The email message, followed by the alerts of the report when alerts is True (str)
+    """
+
+    if not alerts:
+        return body
+    from report_functions import get_alerts, get_alert_text
+    text = get_alert_text(get_alerts(ctx))
+    return body + ("\n\n" + text if text else "")
+
+
+def render(df, pool=None):
+    """
+    In:
+        df: All of the data (Pandas DataFrame)
+        pool: Running pool from open_render_pool, a new one with workers processes if None (ProcessPoolExecutor)
+    Does: Creates all plots in the attachments folder, skipping the ones whose data hasn't changed.
+          With the pdf report format they are drawn into today's PDF instead. The mail body with the
+          alerts is saved for send.
+    Returns:
+        None
+    """
+
+    from report_functions import prepare_report, get_cache_file, open_render_cache, close_render_cache, get_report_jobs, \
+                                 run_plot_jobs, write_report_pdf
+    ctx = prepare_report(df, get_cache_file(cache_path, sheet, 1, "stats"), profile, groups)
+    jobs = get_report_jobs(attatchment_path, groups, ctx, top_correlations, show, compare_pairs, stat_windows)
+    with open(get_body_file(), "w", encoding="utf-8") as f:
+        f.write(get_body(ctx))
+    if report_format == "pdf":
+        write_report_pdf(jobs, ctx, get_pdf_file())
+        return
+    open_render_cache(ctx, attatchment_path)
+    run_plot_jobs(jobs, ctx, 1 if show else workers, pool)
+    close_render_cache(ctx)
+
 
-# Call functions 
-df = get_journal_df(creds_path, scope, sheet)
-create_all_data_plots(df, attatchment_path, show=show)
-rank_columns_correlation_plot(df, attatchment_path, show=show)
-rank_columns_mean_plot(df, attatchment_path, show=show)
-rank_columns_std_plot(df, attatchment_path, show=show)
-create_all_group_plots(df, attatchment_path, groups, show=show)
-
-#Check if send_mail is True
-if send_mail:
-    # Email details
-    message = MIMEMultipart()
-    message["From"] = bot_mail
-    message["To"] = receiver_email
-    message["Subject"] = "Good morning"
-    message["Bcc"] = receiver_email
-
-    # Add attatchments to Email, based on the attachments folder
-    directory = r"{}".format(attatchment_path)
-    for filename in os.listdir(directory):
-        if filename.endswith(".jpg") or filename.endswith(".png"):  # Loop the images. 
-            file = attatchment_path + filename
-            with open(file, "rb") as attachment:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(attachment.read())
-            encoders.encode_base64(part) # Encode
-            part.add_header(  # Attatchment name in email. Important for opening. 
-                "Content-Disposition",
-                f"attachment; filename= {filename}")
-            message.attach(part)
-
-    # Email message
-    body = "Här är den dagliga statistikrapporten från journalen \n Lycka till idag!"
-    message.attach(MIMEText(body, "plain"))
-
-    # Send email
-    port = 465
+def send():
+    """
+    Does: Mails the images of the last render, or today's PDF, with the body it saved.
+    Returns:
+        None
+    """
+
+    import ssl
+    from report_mail import get_report_attachments, write_report_message, write_html_report_message, open_smtp, send_report
+
+    # Attach the images listed in the render manifest
+    attachments = [get_pdf_file()] if report_format == "pdf" else get_report_attachments(attatchment_path)
+    write_message = write_html_report_message if report_format == "html" else write_report_message
+    text = body
+    if os.path.exists(get_body_file()):
+        with open(get_body_file(), encoding="utf-8") as f:
+            text = f.read()
+
+    # Send email, the message is spooled to disk and streamed to the server
     context = ssl.create_default_context()
-    with smtplib.SMTP_SSL("smtp.gmail.com", port, context=context) as server:
-        server.login(bot_mail, password)
-        server.sendmail(bot_mail, receiver_email, message.as_string())
+    with write_message(bot_mail, receiver_email, "Good morning", text, attachments, bcc=receiver_email) as message, \
+         open_smtp("smtp.gmail.com", port, bot_mail, password, context) as server:
+        send_report(server, bot_mail, receiver_email, message)
+        print("Sent. " + str(datetime.now()))
+
+
+async def run():
+    """
+    Does: Fetches, renders and sends the report with the stages overlapped. The render workers are started
+          first, then the SMTP login runs while the sheet is fetched and the plots are rendered. As images, every image is added to the message as
+          soon as it is saved and only the upload itself waits for the last plot. As html or pdf, the
+          message is written when the plots or the PDF are done.
+    Returns:
+        None
+    """
+
+    import asyncio, ssl, smtplib
+    from report_functions import prepare_report, get_cache_file, open_render_cache, close_render_cache, get_report_jobs, \
+                                 open_render_pool, stream_plot_jobs, write_report_pdf
+    from report_mail import start_report_message, add_attachment, finish_report_message, write_report_message, \
+                            write_html_report_message, open_smtp, send_report
+
+    def login():
+        return open_smtp("smtp.gmail.com", port, bot_mail, password, ssl.create_default_context())
+
+    # Start the workers before the login and fetch threads, forking from a process with running threads isn't safe
+    pool = open_render_pool(workers) if workers > 1 and report_format != "pdf" else None
+    server = asyncio.create_task(asyncio.to_thread(login)) if send_mail else None
+    message = start_report_message(bot_mail, receiver_email, "Good morning", bcc=receiver_email)
+    try:
+        with timed("fetch"):
+            df = await asyncio.to_thread(fetch)
+        with timed("render"):
+            ctx = prepare_report(df, get_cache_file(cache_path, sheet, 1, "stats"), profile, groups)
+            jobs = get_report_jobs(attatchment_path, groups, ctx, top_correlations, compare=compare_pairs, windows=stat_windows)
+            text = get_body(ctx)
+            if report_format == "pdf":
+                pdf_file = await asyncio.to_thread(write_report_pdf, jobs, ctx, get_pdf_file())
+                message.close()
+                message = await asyncio.to_thread(write_report_message, bot_mail, receiver_email, "Good morning", text, \
+                                                  [pdf_file], receiver_email)
+            else:
+                open_render_cache(ctx, attatchment_path)
+                images = []
+                async for image in stream_plot_jobs(jobs, ctx, workers, pool):
+                    if report_format == "html":
+                        images.append(image)
+                    else:
+                        await asyncio.to_thread(add_attachment, message, image)
+                close_render_cache(ctx)
+                if report_format == "html":
+                    message.close()
+                    message = await asyncio.to_thread(write_html_report_message, bot_mail, receiver_email, "Good morning", \
+                                                      text, sorted(images), receiver_email)
+                else:
+                    finish_report_message(message, text)
+
+        #Check if send_mail is True
+        if server is None:
+            print("Done. " + str(datetime.now()))
+            return
+        with timed("send"):
+            connection = await server
+            try:
+                await asyncio.to_thread(send_report, connection, bot_mail, receiver_email, message)
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle connection during a long render, log in again
+                connection = await asyncio.to_thread(login)
+                await asyncio.to_thread(send_report, connection, bot_mail, receiver_email, message)
+            connection.quit()
         print("Sent. " + str(datetime.now()))
+    finally:
+        message.close()
+        if server is not None and not server.done():
+            server.cancel()
+        if pool is not None:
+            pool.shutdown()
+
+
+def main(argv=None):
+    """
+    In:
+        argv: Command line arguments, sys.argv if None (list)
+    Does: Runs the command given on the command line, timed or profiled if asked to.
+    Returns:
+        None
+    """
+
+    parser = argparse.ArgumentParser(prog="journal_report", description="Daily statistics report from the journal sheet.")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "fetch", "render", "send"])
+    parser.add_argument("--timings", metavar="FILE", help="write the timings of the run, FILE.prom as a Prometheus textfile, else JSON")
+    parser.add_argument("--profile", metavar="FILE", help="write cProfile stats of the main process")
+    args = parser.parse_args(argv)
+
+    if args.timings:
+        for module in command_modules[args.command]:
+            instrument(importlib.import_module(module))
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with timed("total"):
+            run_command(args.command)
+    finally:
+        if args.profile:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.timings:
+            write_timings(args.timings)
+
+
+def run_command(command):
+    """
+    In:
+        command: One of run, fetch, render or send (str)
+    Returns:
+        None
+    """
+
+    if command == "fetch":
+        with timed("fetch"):
+            fetch()
+        print("Fetched. " + str(datetime.now()))
+    elif command == "render":
+        with timed("fetch"):
+            df = fetch()
+        with timed("render"):
+            render(df)
+        print("Done. " + str(datetime.now()))
+    elif command == "send":
+        with timed("send"):
+            send()
+    else:
+        import asyncio
+        asyncio.run(run())
+
 
-else: print("Done. " + str(datetime.now()))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
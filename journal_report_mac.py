@@ -1,18 +1,11 @@
 # Main journal report file
 
 # Import dependencies   
-import smtplib, ssl, email, imapclient, time, csv, gspread, os
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd 
+import os
 from datetime import datetime
-from matplotlib import pyplot as plt
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-from report_functions import (get_journal_df, create_all_data_plots, rank_columns_correlation_plot, rank_columns_mean_plot, \
-                         rank_columns_std_plot, create_all_group_plots)
+from report_functions import (get_journal_df, get_cache_file, prepare_report, open_render_cache, close_render_cache, create_all_data_plots, rank_columns_correlation_plot, rank_columns_mean_plot, \
+                         rank_columns_std_plot, create_all_group_plots, get_alerts, get_alert_text)
+from report_mail import get_report_attachments, write_report_message, open_smtp, send_report
 from config import password, receiver_email, creds_path, attatchment_path, bot_mail, sheet, scope 
 
 # Defining the groups
@@ -26,48 +19,40 @@ groups={
 show = False
 send_mail = True
 now = str(datetime.now())
-
-# Call functions 
-df = get_journal_df(creds_path, scope, sheet)
-create_all_data_plots(df, attatchment_path, show=show)
-create_all_group_plots(df, attatchment_path, groups, show=show)
-
-rank_columns_correlation_plot(df, attatchment_path, show=show)
-rank_columns_mean_plot(df, attatchment_path, show=show)
-rank_columns_std_plot(df, attatchment_path, show=show)
-
-# Email details
-message = MIMEMultipart()
-message["From"] = bot_mail
-message["To"] = receiver_email
-message["Subject"] = "Good morning"
-message["Bcc"] = receiver_email
-
-# Add attatchments to Email, based on the attachments folder
-directory = r"{}".format(attatchment_path)
-for filename in os.listdir(directory):
-    if filename.endswith(".jpg") or filename.endswith(".png"):  # Loop the images. 
-        file = attatchment_path + filename
-        with open(file, "rb") as attachment:
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(attachment.read())
-        encoders.encode_base64(part) # Encode
-        part.add_header(  # Attatchment name in email. Important for opening. 
-            "Content-Disposition",
-            f"attachment; filename= {filename}")
-        message.attach(part)
-
-# Email message
-body = "Här är den dagliga statistikrapporten från journalen \n Lycka till idag!"
-message.attach(MIMEText(body, "plain"))
-
-# Send email
-port = 465
-#context = ssl.create_default_context()
-#with smtplib.SMTP_SSL("smtp.gmail.com", port, context=context) as server:
-with smtplib.SMTP_SSL("smtp.gmail.com", port) as server:
-    server.login(bot_mail, password)
-    if send_mail:
-        server.sendmail(bot_mail, receiver_email, message.as_string())
-        print("Sent. " + now)
-    else: print("Done. " + now)
\ No newline at end of file
+workers = os.cpu_count() or 1 # Processes used to render the plots
+cache_path = "journal_cache/" # Local copy of the sheet, delete it to fetch everything again
+top_correlations = None # Number of strongest correlations to plot, None plots report_functions.MAX_CORRELATIONS
+profile = "email" # Output profile of the plots: email, email-png, archive or vector, see report_functions.PROFILES
+
+# Only when run as a script, render workers that spawn import this file again
+if __name__ == "__main__":
+    # Call functions 
+    df = get_journal_df(creds_path, scope, sheet, cache_path=cache_path)
+    ctx = prepare_report(df, get_cache_file(cache_path, sheet, 1, "stats"), profile, groups)
+    open_render_cache(ctx, attatchment_path)
+    create_all_data_plots(df, attatchment_path, show=show, ctx=ctx, workers=workers)
+    create_all_group_plots(df, attatchment_path, groups, show=show, ctx=ctx, workers=workers)
+
+    rank_columns_correlation_plot(df, attatchment_path, show=show, ctx=ctx, top=top_correlations)
+    rank_columns_mean_plot(df, attatchment_path, show=show, ctx=ctx)
+    rank_columns_std_plot(df, attatchment_path, show=show, ctx=ctx)
+    close_render_cache(ctx)
+
+    # Attach the images listed in the render manifest
+    attachments = get_report_attachments(attatchment_path)
+
+    # Email message, with the outliers, streaks and shifts of the metrics
+    body = "Här är den dagliga statistikrapporten från journalen \n Lycka till idag!"
+    alerts = get_alert_text(get_alerts(ctx))
+    if alerts:
+        body += "\n\n" + alerts
+
+    # Send email, the message is spooled to disk and streamed to the server
+    port = 465
+    #context = ssl.create_default_context()
+    with write_report_message(bot_mail, receiver_email, "Good morning", body, attachments, bcc=receiver_email) as message, \
+         open_smtp("smtp.gmail.com", port, bot_mail, password) as server:
+        if send_mail:
+            send_report(server, bot_mail, receiver_email, message)
+            print("Sent. " + now)
+        else: print("Done. " + now)
\ No newline at end of file
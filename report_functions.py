@@ -1,46 +1,88 @@
 # Functions
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import pprint 
-import pandas as pd 
-from matplotlib import pyplot as plt
-import imapclient
-import smtplib, ssl
-import email
-import numpy as np
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 import os 
-from  matplotlib.colors import LinearSegmentedColormap
-import matplotlib.ticker as ticker
-import time
-from scipy.ndimage.filters import gaussian_filter1d
+import json
+import hashlib
+import multiprocessing
+import pickle
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+from functools import partial
+import numpy as np
+import pandas as pd 
+from report_timing import timed, pop_timings, add_timings
+
+# gspread, matplotlib and scipy are imported by the functions that use them, 
+# so fetching the sheet doesn't load the plotting libraries and the other way around
 
 # Define all necessary functions
 
+# Sigmas that prepare_report smooths the data with
+SIGMAS = (1.7, 1)
+
 def int_columns(df):
     """
     In: 
-        df: All of the data (Pandas DataFrame)
+        df: Rows of the sheet, or data from int_columns (Pandas DataFrame)
+    Does: Makes the compact journal. The metrics become float32 columns, the dates the index, the days a 
+          categorical, and the journal text a bool column that tells if the day has an entry. The text 
+          itself is not kept. Columns that are already compact are kept as they are. 
     Returns:
-        The columns that are not Day, Date or Journal (df)
+        The journal with the Day and Journal columns and the metrics, indexed by Date (Pandas DataFrame)
     """
 
+    columns = {}
     for column in df.columns:
-        if column not in ['Day', 'Date', 'Journal']:
-            df[column] = pd.to_numeric(df[column], errors='coerce')
-    return df
+        if column == "Day":
+            columns[column] = pd.Categorical(df[column].astype(str))
+        elif column == "Journal":
+            columns[column] = get_entries(df)
+        elif column != "Date":
+            columns[column] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float32)
+    index = pd.DatetimeIndex(pd.to_datetime(df["Date"], errors="coerce"), name="Date") if "Date" in df.columns else df.index
+    return pd.DataFrame(columns, index=index)
+
+
+def get_entries(df):
+    """
+    In: 
+        df: All of the data, compact or with the journal text (Pandas DataFrame)
+    Returns: 
+        True for every day with a journal entry (numpy bool array)
+    """
+
+    journal = df["Journal"]
+    if journal.dtype == bool:
+        return journal.to_numpy()
+    return (journal.astype(str).str.len() != 0).to_numpy()
 
 
-def get_journal_df(creds_path, scope, sheet):
+def get_client(creds_path, scope):
+    """
+    In: 
+        creds_path: path to json file with gspread credentials (str)
+        scope: list with api scope (list)
+    Does: Authorizes with Google Sheets, the client can be reused for several sheets. 
+    Returns:
+        Authorized client (gspread Client)
+    """
+
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
+    return gspread.authorize(creds)
+
+
+def get_journal_df(creds_path, scope, sheet, cache_path=None, gc=None, worksheet=1):
     """
     In: 
         creds_path: path to json file with gspread credentials (str)
         scope: list with api scope (list)
         sheet: string with name of sheet that has the data 
+        cache_path: Folder for the local sheet cache, None downloads the whole sheet (str)
+        gc: Client from get_client, authorizes a new one if None (gspread Client)
+        worksheet: Index of the worksheet with the data (int)
 
     Does: API call to get data. Initial processing of data. 
     Returns:
@@ -48,9 +90,12 @@ def get_journal_df(creds_path, scope, sheet):
     """
 
     # Load in Data from Google Sheets
-    creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
-    gc = gspread.authorize(creds)
-    j2020 = gc.open(sheet).get_worksheet(1)
+    gc = gc or get_client(creds_path, scope)
+    j2020 = gc.open(sheet).get_worksheet(worksheet)
+
+    # Only parse the changed rows when there is a cache
+    if cache_path is not None:
+        return sync_journal_df(j2020, get_cache_file(cache_path, sheet, worksheet))
 
     # Set data from Sheet in DataFrame
     df = pd.DataFrame(j2020.get_all_records())
@@ -59,28 +104,546 @@ def get_journal_df(creds_path, scope, sheet):
     return int_columns(df)
 
 
+def get_cache_file(cache_path, sheet, worksheet, kind=""):
+    """
+    In: 
+        cache_path: Folder for the local sheet cache (str)
+        sheet: Name of the sheet (str)
+        worksheet: Index of the worksheet in the sheet (int)
+        kind: What is cached, "" for the rows and "stats" for get_column_stats (str)
+    Returns: 
+        Path of the cache file for that worksheet (str)
+    """
+
+    name = "".join(c if c.isalnum() else "_" for c in sheet)
+    return os.path.join(cache_path, name + "_" + str(worksheet) + ("_" + kind if kind else "") + ".pkl")
+
+
+def sync_journal_df(worksheet, cache_file, modified=None):
+    """
+    In: 
+        worksheet: Journal worksheet (gspread Worksheet)
+        cache_file: Path of the cache file from get_cache_file (str)
+        modified: Modified time of the sheet when the caller already asked Drive, see get_modified_time (str)
+    Does: Reads the cached rows from disk. When Drive says the sheet wasn't modified since the cache was 
+          saved, no rows are fetched. Otherwise the checksums the sheet computes for the cached rows, one 
+          cell per row, are compared with the cache, and only the rows from the first one that differs on 
+          are fetched, open ended so new days come along. A new day is then the last few rows. Without 
+          the checksums, or with a changed header, the whole sheet is fetched. 
+    Returns: 
+        All of the data (Pandas DataFrame)
+    """
+
+    import gspread
+    modified = modified or get_modified_time(worksheet)
+    cache = pd.read_pickle(cache_file) if os.path.exists(cache_file) else None
+    if cache is not None and "checksums" not in cache:
+        cache = None # Cache from before the checksums
+    if cache is not None and modified is not None and cache["modified"] == modified:
+        return int_columns(cache["df"])
+
+    header = worksheet.row_values(1)
+    last_column = gspread.utils.rowcol_to_a1(1, len(header))[:-1]
+    first = 0
+    if cache is not None and cache["header"] == header:
+        formula = cache["formula"] or set_checksum_formula(worksheet, header)
+        sheet = get_sheet_checksums(worksheet, len(cache["checksums"])) if formula else None
+        if sheet is not None:
+            # Rows before the first changed one are the same as in the cache
+            changed = np.flatnonzero(~np.isclose(sheet, cache["checksums"], rtol=0, atol=1e-6))
+            first = int(changed[0]) if len(changed) else len(sheet)
+    else:
+        formula = set_checksum_formula(worksheet, header)
+
+    # Sheet row of the first changed row, the header is row 1
+    values = worksheet.get("A" + str(first + 2) + ":" + last_column)
+    rows = [get_record_values(row, header) for row in values]
+    checksums = get_row_checksums(values, rows, header)
+    df = int_columns(pd.DataFrame(rows, columns=header))
+    if first:
+        # int_columns again to merge the days into one categorical
+        df = int_columns(pd.concat([int_columns(cache["df"]).iloc[:first], df]))
+        checksums = np.concatenate([cache["checksums"][:first], checksums])
+    save_journal_cache(cache_file, header, df, checksums, modified, formula)
+    return df
+
+
+def get_modified_time(worksheet):
+    """
+    In: 
+        worksheet: Journal worksheet (gspread Worksheet)
+    Does: Asks Drive when the sheet was last modified, a small metadata request that downloads no rows. 
+    Returns: 
+        Modified time (str), None if Drive can't tell, for example without the Drive scope
+    """
+
+    import gspread
+    try:
+        return worksheet.spreadsheet.get_lastUpdateTime()
+    except (AttributeError, KeyError, gspread.exceptions.APIError):
+        return None
+
+
+def get_checksum_weights(header):
+    """
+    In: 
+        header: Column names of the sheet (list)
+    Returns: 
+        Weight of every column in the checksums, the square of its number, 0 for the text columns (list)
+    """
+
+    return [0 if column in ("Day", "Date", "Journal") else (i + 1) ** 2 for i, column in enumerate(header)]
+
+
+def get_checksum_formula(title, header):
+    """
+    In: 
+        title: Title of the journal worksheet (str)
+        header: Column names of the sheet (list)
+    Does: Writes one formula for the checksum of every row after the header: the length of the row's text, 
+          plus every numeric metric times its weight from get_checksum_weights. It has no argument 
+          separators, so it reads the same in every locale of the spreadsheet. Sheets has no hash 
+          function, so an edit of an earlier entry's text that keeps its length isn't noticed. 
+    Returns: 
+        The formula (str)
+    """
+
+    from gspread.utils import rowcol_to_a1
+    sheet = "'" + title.replace("'", "''") + "'!"
+    columns = [sheet + rowcol_to_a1(1, i + 1)[:-1] + "2:" + rowcol_to_a1(1, i + 1)[:-1] for i in range(len(header))]
+    text = "&".join("TO_TEXT(" + column + ")" for column in columns)
+    numbers = "".join("+IFERROR(" + column + "*" + str(weight) + ")" \
+                      for column, weight in zip(columns, get_checksum_weights(header)) if weight)
+    return "=ARRAYFORMULA(LEN(" + text + ")" + numbers + ")"
+
+
+def get_row_checksums(values, rows, header):
+    """
+    In: 
+        values: Cell values of the sheet rows as the API sends them (list of lists)
+        rows: The same rows from get_record_values (list of lists)
+        header: Column names of the sheet (list)
+    Does: Computes the checksums of get_checksum_formula here. Lengths are counted in UTF-16 units like 
+          the sheet counts them. 
+    Returns: 
+        Checksum of every row (numpy array)
+    """
+
+    weights = get_checksum_weights(header)
+    checksums = np.zeros(len(values))
+    for i, (cells, row) in enumerate(zip(values, rows)):
+        checksums[i] = sum(len(str(cell).encode("utf-16-le")) for cell in cells) // 2 + \
+                       sum(weight * value for weight, value in zip(weights, row) \
+                           if weight and isinstance(value, (int, float)) and not isinstance(value, bool))
+    return checksums
+
+
+def set_checksum_formula(worksheet, header):
+    """
+    In: 
+        worksheet: Journal worksheet (gspread Worksheet)
+        header: Column names of the sheet (list)
+    Does: Puts the formula of get_checksum_formula in a hidden worksheet named after the journal, added 
+          the first time. This needs write access to the spreadsheet. 
+    Returns: 
+        The formula (str), None if it couldn't be written
+    """
+
+    import gspread
+    title = worksheet.title + " checksums"
+    formula = get_checksum_formula(worksheet.title, header)
+    try:
+        spreadsheet = worksheet.spreadsheet
+        try:
+            sheet = spreadsheet.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            sheet = spreadsheet.add_worksheet(title, worksheet.row_count, 1)
+            sheet.hide()
+        sheet.update_acell("A1", formula)
+    except (AttributeError, gspread.exceptions.APIError):
+        return None
+    return formula
+
+
+def get_sheet_checksums(worksheet, rows):
+    """
+    In: 
+        worksheet: Journal worksheet (gspread Worksheet)
+        rows: Number of rows after the header (int)
+    Does: Reads the checksums of the first rows from the worksheet of set_checksum_formula. It gets as many 
+          rows as the journal first, the formula can't fill more rows than its worksheet has. 
+    Returns: 
+        Checksum of every row, NaN where the sheet gave none (numpy array), None if there is no checksum worksheet
+    """
+
+    import gspread
+    try:
+        sheets = {sheet.title: sheet for sheet in worksheet.spreadsheet.worksheets()}
+        sheet, journal = sheets[worksheet.title + " checksums"], sheets[worksheet.title]
+        if sheet.row_count < journal.row_count:
+            sheet.resize(rows=journal.row_count)
+        values = sheet.get("A1:A" + str(max(rows, 1)), major_dimension="COLUMNS", value_render_option="UNFORMATTED_VALUE")
+    except (AttributeError, KeyError, gspread.exceptions.APIError):
+        return None
+    values = ((values[0] if values else []) + [None] * rows)[:rows]
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+
+def get_record_values(row, header):
+    """
+    In: 
+        row: Cell values of one sheet row (list)
+        header: Column names of the sheet (list)
+    Does: Pads the row to the header and numericises it, the same way get_all_records does. 
+    Returns: 
+        Cell values (list)
+    """
+
+    from gspread.utils import numericise_all
+    return numericise_all(list(row) + [""] * (len(header) - len(row)))
+
+
+def save_journal_cache(cache_file, header, df, checksums, modified, formula):
+    """
+    In: 
+        cache_file: Path of the cache file from get_cache_file (str)
+        header: Column names of the sheet (list)
+        df: All of the data (Pandas DataFrame)
+        checksums: Checksums of the sheet rows from get_row_checksums (numpy array)
+        modified: Modified time of the sheet before the rows were fetched, None if unknown (str)
+        formula: Formula of the checksum worksheet, None if the sheet has none (str)
+    Does: Saves the data with what sync_journal_df compares the sheet with. 
+    Returns: 
+        None
+    """
+
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    pd.to_pickle({"header": header, "modified": modified, "formula": formula, "checksums": checksums, "df": df}, cache_file)
+
+
 def get_iMax(df):
     """
     In: 
         df: All of the data (Pandas DataFrame) 
-    Does: Uses journal entries to get max index. (number of entries - 1)
+    Does: Uses journal entries to get max index, the row after the last entry. Days without an entry before 
+          it are kept, their metrics are missing. 
     Returns: 
         Max index (int) 
     """
 
-    return len([len(item) for item in df["Journal"] if len(item) != 0]) #Num datapoints by looking at journal column
+    entries = np.flatnonzero(get_entries(df)) #Rows with a journal entry
+    return int(entries[-1]) + 1 if len(entries) else 0
+
+
+def prepare_report(df, stats_file=None, profile=None, groups=None):
+    """
+    In: 
+        df: All of the data (Pandas DataFrame)
+        stats_file: File that keeps the column statistics between runs, see get_column_stats (str)
+        profile: Output profile of the plots, a key of PROFILES, archive if None (str)
+        groups: Members of every group, see get_group_weights, None leaves the group means to the plots (dict)
+    Does: Scans the data once so the plotting functions don't have to. 
+    Returns: 
+        Report context (dict) with:
+            iMax: Number of entries (int)
+            data: Numeric columns trimmed to iMax (Pandas DataFrame)
+            dates: Dates trimmed to iMax (Pandas DatetimeIndex)
+            x: x position of every entry (numpy array)
+            major_ticks, minor_ticks: x positions of the labeled mondays and the other ticks (numpy array)
+            xlabels: Labels for the major ticks (list)
+            smoothed: Smoothed data for each sigma in SIGMAS (dict of Pandas DataFrames)
+            stats: Count, mean and std of every column (Pandas DataFrame)
+            profile: Output profile of the plots (str)
+            groups: Weight of every member of every group (dict of dicts)
+            group_means: Mean of every group, and smoothed with sigma 1.7 (tuple of Pandas DataFrames)
+    """
+
+    if profile is not None and profile not in PROFILES:
+        raise ValueError("Unknown output profile " + profile + ", use one of " + ", ".join(PROFILES))
+    iMax = get_iMax(df)
+    data = remove_string_columns(df).iloc[:iMax]
+    major_ticks, minor_ticks, xlabels = get_date_ticks(df.index[:iMax])
+    weights = get_group_weights(groups or {})
+    return {
+        "iMax": iMax,
+        "data": data,
+        "dates": df.index[:iMax],
+        "x": np.arange(iMax),
+        "major_ticks": major_ticks,
+        "minor_ticks": minor_ticks,
+        "xlabels": xlabels,
+        "smoothed": {sigma: pd.DataFrame(smooth_data(data, sigma), index=data.index, columns=data.columns) for sigma in SIGMAS},
+        "stats": get_column_stats(data, stats_file),
+        "profile": profile or "archive",
+        "groups": weights,
+        "group_means": get_group_means(data, weights),
+    }
+
+
+def get_column_stats(data, stats_file=None):
+    """
+    In: 
+        data: Numeric columns trimmed to iMax (Pandas DataFrame)
+        stats_file: File that keeps the running statistics between runs, None counts all rows (str)
+    Does: Keeps a running count, mean and sum of squared deviations per column, Welford style. With a 
+          stats file only the rows added since the last run are counted, so a new day costs O(columns). 
+          It starts over when the columns changed, or when the fingerprint of the counted rows shows that 
+          one of them was edited. 
+    Returns: 
+        Count, mean and std of every column, indexed by column (Pandas DataFrame)
+    """
+
+    columns = list(data.columns)
+    values = data.to_numpy(dtype=float)
+    state = pd.read_pickle(stats_file) if stats_file is not None and os.path.exists(stats_file) else None
+    if state is None or state["columns"] != columns or not 0 < state["rows"] <= len(values) \
+       or state.get("hash") != get_values_hash(values[:state["rows"]]):
+        zeros = np.zeros(len(columns))
+        state = {"columns": columns, "rows": 0, "hash": None, "count": zeros, "mean": zeros, "m2": zeros}
+
+    if state["rows"] < len(values):
+        update_column_stats(state, values[state["rows"]:])
+        state["rows"], state["hash"] = len(values), get_values_hash(values)
+        if stats_file is not None:
+            os.makedirs(os.path.dirname(stats_file) or ".", exist_ok=True)
+            pd.to_pickle(state, stats_file)
+
+    count = state["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "count": count,
+            "mean": np.where(count > 0, state["mean"], np.nan),
+            "std": np.where(count > 1, np.sqrt(state["m2"] / (count - 1)), np.nan),
+        }, index=data.columns)
+
+
+def get_values_hash(values):
+    """
+    In: 
+        values: Rows of numbers (2D numpy array)
+    Returns: 
+        Fingerprint of the rows, it changes when any value does (str)
+    """
+
+    from hashlib import blake2b
+    return blake2b(np.ascontiguousarray(values).tobytes(), digest_size=16).hexdigest()
+
+
+def update_column_stats(state, values):
+    """
+    In: 
+        state: Running count, mean and m2 per column (dict of numpy arrays)
+        values: New rows, NaN where a value is missing (2D numpy array)
+    Does: Adds the rows to the running statistics. Instead of one Welford step per row, the rows are 
+          summarized as one block and merged with Chan's formula, which gives the same result. 
+    Returns: 
+        None
+    """
+
+    count = (~np.isnan(values)).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(count > 0, np.nansum(values, axis=0) / count, 0)
+    m2 = np.nansum((values - mean) ** 2, axis=0)
+    total = state["count"] + count
+    delta = mean - state["mean"]
+    share = np.divide(count, total, out=np.zeros(len(total)), where=total > 0)
+    state["mean"] = state["mean"] + delta * share
+    state["m2"] = state["m2"] + m2 + delta ** 2 * state["count"] * share
+    state["count"] = total
+
+
+def get_window_stats(data, windows):
+    """
+    In: 
+        data: Numeric columns trimmed to iMax (Pandas DataFrame)
+        windows: Numbers of last days (tuple of ints)
+    Does: Takes cumulative sums from the last day backwards, once, over the longest window. Every 
+          window is then one row of the sums. 
+    Returns: 
+        Count, mean and std of every column over each window, indexed by window (dict of Pandas DataFrames)
+    """
+
+    values = data.to_numpy(dtype=float)[::-1][:max(windows)]
+    valid = ~np.isnan(values)
+    x = np.where(valid, values, 0)
+    # Row i of the sums covers the last i days, row 0 none
+    ends = [min(window, len(values)) for window in windows]
+    zeros = np.zeros((1, len(data.columns)))
+    count, total, squares = (np.vstack([zeros, np.cumsum(a, axis=0)])[ends] for a in (valid, x, x * x))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares - total * mean, 0) / (count - 1))
+    return {
+        "count": pd.DataFrame(count, index=list(windows), columns=data.columns),
+        "mean": pd.DataFrame(np.where(count > 0, mean, np.nan), index=list(windows), columns=data.columns),
+        "std": pd.DataFrame(np.where(count > 1, std, np.nan), index=list(windows), columns=data.columns),
+    }
+
+
+# Order of the alerts in the mail, their text, and the directions for a positive and a negative value
+ALERTS = {
+    "outlier": ("{metric} {size:.1f}σ {direction} its {days} day mean", "above", "below"),
+    "streak": ("{metric} {direction} {days} days running", "up", "down"),
+    "shift": ("{metric} {direction} {size:.1f}σ over the last {days} days", "up", "down"),
+}
+
+
+def get_alerts(ctx, baseline=30, recent=7, sigmas=2, streak=3, shift=1, min_count=10, min_std=0.5):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+        baseline: Days the last day and the recent days are compared with (int)
+        recent: Days of the recent level in the shifts (int)
+        sigmas: Distance from the baseline mean, in baseline stds, that makes the last day an outlier (float)
+        streak: Days in a row that a metric went up or down to be a streak (int)
+        shift: Change of the smoothed level, in baseline stds, that makes a shift (float)
+        min_count: Values a metric needs in its baseline for outliers and shifts (int)
+        min_std: Smallest baseline std, so a flat baseline still flags a day that leaves it (float)
+    Does: Checks every metric at once, on whole blocks of the data, so the cost grows with rows times columns 
+          and not with a Python loop per column: 
+            outlier: the last day against the mean and std of the baseline days before it 
+            streak: the day to day changes at the end that all go the same way 
+            shift: the mean of the smoothed data over the recent days against the baseline days before them 
+          The means and stds come from get_window_stats, the smoothed data from the context. Stds below 
+          min_std count as min_std, and baselines with fewer than min_count values flag nothing. 
+    Returns: 
+        One row per alert with the metric, the alert, its value in stds, or days with a sign for streaks, 
+        and its days. Strongest first within each alert (Pandas DataFrame)
+    """
+
+    data, smoothed = ctx["data"], ctx["smoothed"][1.7]
+    values = data.to_numpy(dtype=float)
+    alerts = []
+    if len(values) > 2:
+        # Last day against the baseline days before it
+        before = {name: stats.to_numpy()[0] for name, stats in get_window_stats(data.iloc[:-1], (baseline,)).items()}
+        z = (values[-1] - before["mean"]) / np.maximum(before["std"], min_std)
+        alerts.append(("outlier", z, (np.abs(z) >= sigmas) & (before["count"] >= min_count), baseline))
+
+        # Signs of the changes, newest first. A missing day has no sign, so it ends a streak
+        signs = np.sign(np.diff(values[-baseline - 1:], axis=0))[::-1]
+        same = (signs == signs[0]) & (signs[0] != 0)
+        run = np.where(same.all(axis=0), len(signs), same.argmin(axis=0))
+        alerts.append(("streak", run * signs[0], run >= streak, run))
+
+    if len(values) > recent + 1:
+        # Smoothed level of the recent days against the baseline days before them
+        level = get_window_stats(smoothed, (recent,))["mean"].to_numpy()[0]
+        start = get_window_stats(smoothed.iloc[:-recent], (baseline,))["mean"].to_numpy()[0]
+        spread = {name: stats.to_numpy()[0] for name, stats in get_window_stats(data.iloc[:-recent], (baseline,)).items()}
+        change = (level - start) / np.maximum(spread["std"], min_std)
+        alerts.append(("shift", change, (np.abs(change) >= shift) & (spread["count"] >= min_count), recent))
+
+    rows = [(data.columns[i], alert, float(value[i]), int(np.broadcast_to(days, value.shape)[i])) \
+            for alert, value, flagged, days in alerts for i in np.flatnonzero(flagged & np.isfinite(value))]
+    alerts = pd.DataFrame(rows, columns=["metric", "alert", "value", "days"])
+    order = alerts["alert"].map(list(ALERTS).index)
+    return alerts.iloc[np.lexsort((-alerts["value"].abs().to_numpy(), order.to_numpy()))].reset_index(drop=True)
+
+
+def get_alert_text(alerts):
+    """
+    In: 
+        alerts: Alerts from get_alerts (Pandas DataFrame)
+    Returns: 
+        One line per alert, like "Sleep down 3 days running", empty without alerts (str)
+    """
+
+    lines = []
+    for metric, alert, value, days in alerts.itertuples(index=False):
+        text, up, down = ALERTS[alert]
+        lines.append(text.format(metric=metric, size=abs(value), days=days, direction=up if value > 0 else down))
+    return "\n".join(lines)
+
+
+def get_group_weights(groups):
+    """
+    In: 
+        groups: Members of every group, as a list of columns or as a dict of columns and their weights (dict)
+    Returns: 
+        Weight of every member of every group, 1 for the members of a list (dict of dicts)
+    """
+
+    weights = {}
+    for group, members in groups.items():
+        weights[group] = {column: float(weight) for column, weight in members.items()} if isinstance(members, dict) \
+                         else dict.fromkeys(members, 1.0)
+        if not weights[group] or min(weights[group].values()) <= 0:
+            raise ValueError("Group " + str(group) + " needs members with weights above 0")
+    return weights
+
+
+def get_group_means(data, weights):
+    """
+    In: 
+        data: Numeric columns trimmed to iMax (Pandas DataFrame)
+        weights: Weight of every member of every group, from get_group_weights (dict of dicts)
+    Does: Builds the membership matrix of all groups once, columns by groups with the weights of the members, 
+          and takes every group mean in one matrix product. Missing values are left out, so a group's mean 
+          on a day is the weighted mean of the members that have a value. The means are then smoothed in one 
+          smooth_data call, while the members themselves are smoothed once per column by prepare_report, 
+          however many groups they are in. 
+    Returns: 
+        Mean of every group, and the same smoothed with sigma 1.7, NaN where no member has a value 
+        (tuple of Pandas DataFrames)
+    """
+
+    missing = [column for members in weights.values() for column in members if column not in data.columns]
+    if missing:
+        raise KeyError("Group members not in the data: " + ", ".join(dict.fromkeys(missing)))
+    membership = pd.DataFrame(weights, index=data.columns, columns=list(weights), dtype=float).fillna(0).to_numpy()
+    values = data.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = (np.where(valid, values, 0) @ membership) / (valid @ membership)
+    means = pd.DataFrame(means, index=data.index, columns=list(weights))
+    return means, pd.DataFrame(smooth_data(means, 1.7), index=data.index, columns=list(weights))
 
 
-def get_y(df, column1, column2):
+def smooth_data(values, sigma):
+    """
+    In: 
+        values: Data with one row per entry, 1-D or 2-D (Pandas Series, DataFrame or numpy array)
+        sigma: Standard deviation of the gaussian kernel, in entries (float)
+    Does: Smooths every column along the entries in one gaussian_filter1d call. Missing values are left out 
+          and the kernel weights of the rest are normalized, so a gap doesn't spread NaNs to its neighbours. 
+          The weights are smoothed in the same call, next to the values. Without gaps there are no weights 
+          and the result is gaussian_filter1d's. 
+    Returns: 
+        Smoothed data, NaN only where no value is within reach of the kernel (numpy array)
+    """
+
+    from scipy.ndimage import gaussian_filter1d
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    if valid.all():
+        return gaussian_filter1d(values, sigma, axis=0)
+    # One row per column, the values with the gaps as 0 and then their weights, so the kernel runs along rows in memory
+    columns = values.reshape(len(values), -1).T
+    valid = valid.reshape(len(values), -1).T
+    smoothed = np.empty((2 * len(columns), columns.shape[1]))
+    weighted, weights = smoothed[:len(columns)], smoothed[len(columns):]
+    np.copyto(weighted, columns)
+    weighted[~valid] = 0
+    weights[:] = valid
+    gaussian_filter1d(smoothed, sigma, axis=1, output=smoothed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(weights > 0, weighted / weights, np.nan).T.reshape(values.shape)
+
+
+def get_y(df, column1, column2, ctx=None):
     """
     In: 
         df: All of the data (Pandas DataFrame)   
         columns
+        ctx: Report context from prepare_report (dict)
     Returns: 
         Gaussian smoothed data in Tuple. (Tuple with Pandas Series)
     """
 
-    return (gaussian_filter1d(df[column1][:get_iMax(df)], sigma=1.7), gaussian_filter1d(df[column2][:get_iMax(df)], sigma=1.7))
+    ctx = ctx or prepare_report(df)
+    smoothed = ctx["smoothed"][1.7]
+    return (smoothed[column1], smoothed[column2])
 
 
 def remove_string_columns(df):
@@ -91,165 +654,702 @@ def remove_string_columns(df):
         All data without the three generic columns Day, Date, Journal (Pandas DataFrame)
     """
     
-    df_clean = df.copy()
-    try:
-        del df_clean["Day"]
-        del df_clean["Date"]
-        del df_clean["Journal"]
-        return df_clean
-    except:
-        return df_clean
+    return df.drop(columns=[column for column in ("Day", "Date", "Journal") if column in df.columns])
 
 
-def get_xlabels(df):
+def get_xlabels(df, iMax=None):
     """
     In:
         df: All of the data (Pandas DataFrame)
-    Does: Uses data to create xlabels every monday with week number. 
+        iMax: Rows up to the last entry, computed if not given (int)
+    Returns: 
+        Labels of the major ticks, see get_date_ticks (list)
+    """
+
+    if iMax is None:
+        iMax = get_iMax(df)
+    return get_date_ticks(df.index[:iMax])[2]
+
+
+# Most labeled mondays on the date axis, about as many as fit next to each other on the 8.8 inch plots
+MAX_MAJOR_TICKS = 20
+# Most minor ticks when the journal is long enough to thin the labels
+MAX_MINOR_TICKS = 400
+
+
+def get_date_ticks(dates):
+    """
+    In:
+        dates: Dates of the entries (Pandas DatetimeIndex)
+    Does: Finds the mondays in the dates and labels them with the date and the ISO week, all at once. 
+          When there are more than MAX_MAJOR_TICKS mondays only every n-th gets a label, and the other 
+          mondays instead of every day get a minor tick. 
+    Returns: 
+        Positions of the major ticks, positions of the minor ticks, labels of the major ticks (tuple)
+    """
+
+    weekdays = dates.dayofweek.to_numpy()
+    mondays = np.flatnonzero(weekdays == 0)
+    step = max(1, -(-len(mondays) // MAX_MAJOR_TICKS))
+    major = mondays[::step]
+    if step == 1:
+        minor = np.flatnonzero(weekdays != 0)
+    else:
+        minor = np.setdiff1d(mondays, major)
+        minor = minor[::max(1, -(-len(minor) // MAX_MINOR_TICKS))]
+    weeks = dates[major].isocalendar().week.to_numpy().astype(str)
+    return major, minor, list(dates[major].strftime("%Y-%m-%d") + "\n Mån v: " + weeks)
+
+
+def set_date_axis(line, ctx):
+    """
+    In: 
+        line: Axes to configure (matplotlib Axes)
+        ctx: Report context from prepare_report (dict)
+    Does: Sets the monday ticks and labels, and the 1-5 y axis used by the line plots. 
+    Returns: 
+        None
+    """
+
+    line.set_ylim(0.7, 5.3)
+    line.set_xticks(ctx["major_ticks"])
+    line.set_xticks(ctx["minor_ticks"], minor=True)
+    line.set_xticklabels(ctx["xlabels"], rotation=90)
+    line.set_yticks([1,2,3,4,5])
+    line.tick_params(axis='y', which='major', labelsize=10)
+    line.grid(axis = "y", linestyle="-", color="darkgray")
+
+
+def open_render_cache(ctx, attatchment_path):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+        attatchment_path: Path where plots will be saved (str)
+    Does: Loads the render manifest of the folder into the context, so unchanged plots are not rendered again. 
+    Returns: 
+        None
+    """
+
+    manifest_file = attatchment_path + "render_manifest.json"
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    ctx["render_cache"] = {"file": manifest_file, "manifest": manifest, "used": {}}
+
+
+def close_render_cache(ctx):
+    """
+    In: 
+        ctx: Report context with a render cache from open_render_cache (dict)
+    Does: Deletes the images from the last run that were not used in this run and saves the new manifest. 
+    Returns: 
+        None
+    """
+
+    cache = ctx["render_cache"]
+    for image in cache["manifest"].keys() - cache["used"].keys():
+        if os.path.exists(image):
+            os.remove(image)
+    with open(cache["file"], "w") as f:
+        json.dump(cache["used"], f, indent=1, sort_keys=True)
+
+
+# Output profiles, the format and resolution of the saved plots
+PROFILES = {
+    "archive": {"format": "png", "dpi": 300},
+    "email": {"format": "webp", "dpi": 110, "pil_kwargs": {"quality": 80}},
+    "email-png": {"format": "png", "dpi": 110}, # For mail clients that don't show WebP
+    "vector": {"format": "svg", "dpi": 150}, # dpi of the background gradient only
+}
+
+# Largest width or height of a WebP image
+WEBP_MAX_PIXELS = 16383
+
+# Lowest resolution a plot is saved with to fit a size limit, below it the text can't be read
+MIN_DPI = 72
+
+
+def get_profile(ctx):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+    Returns: 
+        Output profile of the report, archive if none is set (dict)
+    """
+
+    return PROFILES[ctx.get("profile", "archive")]
+
+
+def get_image_file(path, ctx):
+    """
+    In: 
+        path: Path of the plot without extension (str)
+        ctx: Report context from prepare_report (dict)
+    Returns: 
+        Path of the image in the format of the output profile (str)
+    """
+
+    return path + "." + get_profile(ctx)["format"]
+
+
+def get_render_key(function, ctx, columns, *args):
+    """
+    In: 
+        function: Plot function that draws the figure (function)
+        ctx: Report context from prepare_report (dict)
+        columns: Data columns the figure uses (list)
+        args: Other values that change the figure (str)
+    Does: Hashes the code of the function and the drawing helpers, the output profile, the colors, the matplotlib version, 
+          the date axis, the data and args. 
+    Returns: 
+        Render key (str)
+    """
+
+    import matplotlib
+    key = hashlib.sha1()
+    for f in (function, set_date_axis, smooth_data, get_plot_template, draw_lines):
+        code = getattr(f, "__wrapped__", f).__code__ # The same key with --timings
+        key.update(code.co_code)
+        key.update(repr([c for c in code.co_consts if not hasattr(c, "co_code")]).encode())
+    key.update(repr((matplotlib.__version__, get_profile(ctx), DATA_COLORS, COMPARE_COLORS, ctx["iMax"], ctx["xlabels"], list(columns), args)).encode())
+    key.update(ctx["major_ticks"].tobytes() + ctx["minor_ticks"].tobytes())
+    key.update(pd.util.hash_pandas_object(ctx["data"][list(columns)], index=False).to_numpy().tobytes())
+    return key.hexdigest()
+
+
+def is_rendered(ctx, path, key):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+        path: Path of the image from get_image_file (str)
+        key: Render key from get_render_key (str)
+    Does: Records that the figure is used in this run. 
+    Returns: 
+        True if the image on disk was rendered from the same inputs (Boolean)
+    """
+
+    cache = ctx.get("render_cache")
+    if cache is None:
+        return False
+    cache["used"][path] = key
+    return cache["manifest"].get(path) == key and os.path.exists(path)
+
+
+# Report context of a render worker process, set once by _init_render_worker
+_worker_ctx = None
+
+# Report contexts a worker of a shared pool loaded from share_render_context, only the last report's is kept
+_worker_contexts = {}
+
+
+def _init_render_worker(ctx):
+    """
+    In: 
+        ctx: Report context from prepare_report, None when the jobs bring a report id (dict)
+    Does: Switches the worker to the headless Agg backend and keeps the context for its jobs. 
+    Returns: 
+        None
+    """
+
+    global _worker_ctx
+    from matplotlib import pyplot as plt
+    plt.switch_backend("Agg")
+    _worker_ctx = ctx
+    pop_timings() # Forked workers start with the timings of the main process
+
+
+def _render_job(job, ctx=None):
+    """
+    In: 
+        job: Plot function, its arguments without df and ctx, and its keyword arguments (tuple)
+        ctx: Report id from share_render_context, the worker's context if None (str)
+    Does: Runs one plot function in a worker process, which keeps its plot templates between jobs. 
+    Returns: 
+        Path of the image, the images the job used for the render cache of the main process, 
+        and the timings of the job (tuple)
+    """
+
+    ctx = _get_worker_ctx(ctx)
+    cache = ctx.get("render_cache")
+    if cache is not None:
+        cache["used"].clear()
+    image = _run_plot_job(job, ctx)
+    return image, (cache["used"] if cache is not None else None), pop_timings()
+
+
+def _get_worker_ctx(report):
+    """
+    In: 
+        report: Report id from share_render_context, None for the context of the pool (str)
+    Does: Loads the context of a report the first time one of its jobs reaches this worker, and drops 
+          the context of the report before. 
+    Returns: 
+        Report context (dict)
+    """
+
+    if report is None:
+        return _worker_ctx
+    if report not in _worker_contexts:
+        _worker_contexts.clear()
+        with open(report, "rb") as f:
+            _worker_contexts[report] = pickle.load(f)
+    return _worker_contexts[report]
+
+
+@contextmanager
+def share_render_context(ctx):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+    Does: Pickles the context once into a temporary file for the workers of a shared pool. Each worker 
+          loads it once, with its first job of the report, so a job only carries its own arguments. 
+          The file is removed when the report is done. 
+    Returns: 
+        Report id to send with the jobs (str)
+    """
+
+    fd, path = tempfile.mkstemp(prefix="report_" + uuid.uuid4().hex + "_", suffix=".pkl")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(ctx, f, protocol=pickle.HIGHEST_PROTOCOL)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _run_plot_job(job, ctx):
+    """
+    In: 
+        job: Plot function, its arguments without df and ctx, and its keyword arguments (tuple)
+        ctx: Report context from prepare_report (dict)
+    Does: Runs one plot function in this process and times it. 
+    Returns: 
+        Path of the image (str)
+    """
+
+    function, args, kwargs = job
+    with timed("plot", function=function.__name__) as record:
+        record["image"] = function(None, *args, ctx=ctx, **kwargs)
+    return record["image"]
+
+
+def _render_pool(ctx, workers):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+        workers: Number of processes (int)
+    Returns: 
+        Process pool whose workers render with the context (ProcessPoolExecutor)
+    """
+
+    # The default start method of the platform, spawn on macOS where forking after the GUI libraries
+    # are loaded isn't safe. The scripts that render have a __main__ guard for spawn to import them again
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(), \
+                               initializer=_init_render_worker, initargs=(ctx,))
+
+
+def open_render_pool(workers):
+    """
+    In: 
+        workers: Number of processes (int)
+    Does: Starts a process pool that several reports can share, each report sends its context once 
+          with share_render_context. 
+    Returns: 
+        Process pool for run_plot_jobs, use it in a with block (ProcessPoolExecutor)
+    """
+
+    pool = _render_pool(None, workers)
+    # Start the workers now, forking later from a process with running threads isn't safe
+    pool.submit(int).result()
+    return pool
+
+
+def run_plot_jobs(jobs, ctx, workers=1, pool=None):
+    """
+    In: 
+        jobs: Plot functions, their arguments without df and ctx, and their keyword arguments (list of tuples)
+        ctx: Report context from prepare_report (dict)
+        workers: Number of processes to render in, 1 renders in this process (int)
+        pool: Shared pool from open_render_pool, used instead of workers (ProcessPoolExecutor)
+    Does: Renders every job, spread over a process pool when workers > 1 or a pool is given. 
+    Returns: 
+        Paths of the images, in the order of the jobs (list)
+    """
+
+    if pool is not None:
+        with share_render_context(ctx) as report:
+            return _collect_images(pool.map(partial(_render_job, ctx=report), jobs), ctx)
+    if workers <= 1:
+        images = [_run_plot_job(job, ctx) for job in jobs]
+        close_plot_templates()
+        return images
+    with _render_pool(ctx, workers) as pool:
+        return _collect_images(pool.map(_render_job, jobs), ctx)
+
+
+def _collect_images(results, ctx):
+    """
+    In: 
+        results: Results of _render_job (iterable of tuples)
+        ctx: Report context from prepare_report (dict)
+    Does: Adds the images the workers used to the render cache and their timings to the timings of this process. 
+    Returns: 
+        Paths of the images (list)
+    """
+
+    images = []
+    for image, used, timings in results:
+        images.append(image)
+        add_timings(timings)
+        if used:
+            ctx["render_cache"]["used"].update(used)
+    return images
+
+
+async def stream_plot_jobs(jobs, ctx, workers=1, pool=None):
+    """
+    In: 
+        jobs: Plot functions, their arguments without df and ctx, and their keyword arguments (list of tuples)
+        ctx: Report context from prepare_report (dict)
+        workers: Number of processes to render in, 1 renders in one background thread (int)
+        pool: Shared pool from open_render_pool, used instead of workers (ProcessPoolExecutor)
+    Does: Renders every job like run_plot_jobs, without blocking the event loop. 
+    Returns: 
+        Async iterator over the paths of the images, each as soon as it is saved
+    """
+
+    import asyncio
+    loop = asyncio.get_running_loop()
+    if pool is None and workers <= 1:
+        from concurrent.futures import ThreadPoolExecutor
+        from matplotlib import pyplot as plt
+        plt.switch_backend("Agg") # GUI backends only work in the main thread
+        with ThreadPoolExecutor(max_workers=1) as thread:
+            for job in jobs:
+                yield await loop.run_in_executor(thread, _run_plot_job, job, ctx)
+            await loop.run_in_executor(thread, close_plot_templates)
+        return
+
+    with ExitStack() as stack:
+        if pool is None:
+            pool, report = stack.enter_context(_render_pool(ctx, workers)), None
+        else:
+            report = stack.enter_context(share_render_context(ctx))
+        for future in asyncio.as_completed([loop.run_in_executor(pool, _render_job, job, report) for job in jobs]):
+            image, used, timings = await future
+            add_timings(timings)
+            if used:
+                ctx["render_cache"]["used"].update(used)
+            yield image
+
+
+def write_report_pdf(jobs, ctx, path):
+    """
+    In: 
+        jobs: Plot functions, their arguments without df and ctx, and their keyword arguments (list of tuples)
+        ctx: Report context from prepare_report (dict)
+        path: Path of the PDF (str)
+    Does: Draws every job in this process straight into one multi-page PDF, one page per plot, without 
+          writing an image per plot. The pages are vector graphics, and the render cache is not used. 
+    Returns: 
+        Path of the PDF (str)
+    """
+
+    from matplotlib import pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    plt.switch_backend("Agg") # Nothing is shown, and it can run in a background thread
+    pdf_ctx = {key: value for key, value in ctx.items() if key != "render_cache"}
+    with timed("pdf", image=path) as record, PdfPages(path, metadata={"Title": os.path.basename(path)}) as pdf:
+        pdf_ctx["pdf"] = pdf
+        for job in jobs:
+            _run_plot_job(job, pdf_ctx)
+        close_plot_templates()
+    record["bytes"] = os.path.getsize(path)
+    return path
+
+
+def get_report_jobs(attatchment_path, groups, ctx, top=None, show=False, compare=0, windows=()):
+    """
+    In: 
+        attatchment_path: Path where plots will be saved (str)
+        groups: All of the groups, see get_group_weights (dict)
+        ctx: Report context from prepare_report (dict)
+        top: Number of strongest correlations to plot, None plots the MAX_CORRELATIONS strongest (int)
+        show: Decides if plots are shown or not, only when rendered with 1 worker (Boolean)
+        compare: Number of most correlated pairs to plot with compare_plot, None plots all pairs (int)
+        windows: Numbers of last days to add to the mean and std plots (tuple)
+    Returns: 
+        Jobs for every plot of the daily report, for run_plot_jobs or stream_plot_jobs (list of tuples)
+    """
+
+    return [(create_data_plot, (column, attatchment_path, show), {}) for column in ctx["data"]] + [
+        (rank_columns_correlation_plot, (attatchment_path, show), {"top": top}),
+        (rank_columns_mean_plot, (attatchment_path, show), {"windows": windows}),
+        (rank_columns_std_plot, (attatchment_path, show), {"windows": windows}),
+    ] + [(create_group_plot, (attatchment_path, group, groups, show), {}) for group in groups.keys()] \
+      + (get_compare_jobs(attatchment_path, ctx, compare) if compare != 0 else [])
+
+
+# Plot templates of this process by background colors, see get_plot_template
+_templates = {}
+
+# Backgrounds of the line plots, from good to bad
+DATA_COLORS = ("#008702","#7fe393", "#f4f4f4","#F6BCB6", "#B23131")
+COMPARE_COLORS = ("#31B247","#B6F6BE", "#f4f4f4","#F6BCB6", "#B23131")
+
+
+def get_plot_template(ctx, colors):
+    """
+    In: 
+        ctx: Report context from prepare_report (dict)
+        colors: Colors of the background gradient (tuple)
+    Does: Creates the figure with the background and date axis once, and reuses it for every plot with 
+          the same colors and dates. A template for other dates replaces the old one, which is closed. 
+    Returns: 
+        Template (dict) with figure, axes and the lines drawn by draw_lines
+    """
+
+    from matplotlib import pyplot as plt
+    iMax = ctx["iMax"]
+    key = (iMax, tuple(ctx["xlabels"]), ctx["major_ticks"].tobytes(), ctx["minor_ticks"].tobytes())
+    template = _templates.get(colors)
+    if template is not None and template["key"] == key:
+        return template
+    if template is not None:
+        plt.close(template["figure"])
+
+    # Initialize figure and plot, use cmap as background
+    from matplotlib.colors import LinearSegmentedColormap
+    fig, line = plt.subplots(figsize=(8.8,5), sharex=True, sharey=True)
+    cmap = LinearSegmentedColormap.from_list('krg', list(colors), N=256)
+    line.imshow([[0,0],[1,1]], cmap=cmap, interpolation='bicubic', extent=[0,iMax,0.7,5.3], aspect=iMax/14)
+    line.set_xlim(0, iMax)
+    set_date_axis(line, ctx)
+    _templates[colors] = template = {"key": key, "figure": fig, "axes": line, "lines": []}
+    return template
+
+
+def draw_lines(template, ctx, lines, title, path, show=False):
+    """
+    In: 
+        template: Template from get_plot_template (dict)
+        ctx: Report context from prepare_report (dict)
+        lines: y values and Line2D properties of every line, in drawing order (list of tuples)
+        title: Title of the plot (str)
+        path: Path of the image from get_image_file (str)
+        show: Decides if plot is shown or not (Boolean)
+    Does: Updates the template's lines with set_data, empties and hides the ones not needed, and saves the figure. 
+    Returns: 
+        None
+    """
+
+    from matplotlib import pyplot as plt
+    line, artists = template["axes"], template["lines"]
+    for i, (y_values, properties) in enumerate(lines):
+        if i == len(artists):
+            artists.append(line.plot([], [], scalex=False, scaley=False)[0])
+        artists[i].set_data(ctx["x"], y_values)
+        artists[i].set(**dict({"visible": True, "linestyle": "-", "marker": "None", "label": "_nolegend_"}, **properties))
+    for artist in artists[len(lines):]:
+        # Without data, the legend doesn't keep clear of a hidden line when it looks for the best place
+        artist.set(data=([], []), visible=False, label="_nolegend_")
+
+    # Plot configs
+    line.legend(handles=[artist for artist in artists[:len(lines)] if not artist.get_label().startswith("_")])
+    line.set_title(title)
+    # tight_layout starts from the subplot parameters, reset them so every plot gets the layout of a new figure
+    template["figure"].subplots_adjust(**{key: plt.rcParams["figure.subplot." + key] for key in ("left", "right", "bottom", "top")})
+    with timed("tight_layout"):
+        template["figure"].tight_layout()
+    save_plot(template["figure"], path, ctx)
+
+    # Use show argument to decide wheter to plot or not, closing the window closes the figure
+    if show:
+        plt.show()
+        close_plot_templates()
+
+
+def save_plot(fig, path, ctx):
+    """
+    In: 
+        fig: Figure to save (matplotlib Figure)
+        path: Path of the image from get_image_file (str)
+        ctx: Report context from prepare_report (dict)
+    Does: Saves the figure in the format and resolution of the output profile, and times it with the size of the file. 
+          A figure too large for WebP is saved with the largest resolution that fits, down to MIN_DPI. 
+          A figure too large even then is narrowed until it fits. 
+          When the context has a PDF from write_report_pdf the figure becomes its next page instead. 
+    Returns: 
+        None
+    """
+
+    pdf = ctx.get("pdf")
+    if pdf is not None:
+        with timed("savefig", image=path):
+            pdf.savefig(fig, facecolor="#f4f4f4", transparent=True)
+        return
+    profile = get_profile(ctx)
+    if profile["format"] == "webp":
+        # WebP has a size limit, a very wide plot like the correlations of many metrics gets a lower resolution
+        size = fig.get_size_inches()
+        dpi = max(min(profile["dpi"], int(WEBP_MAX_PIXELS / max(size))), min(profile["dpi"], MIN_DPI))
+        if max(size) * dpi > WEBP_MAX_PIXELS:
+            fig.set_size_inches(np.minimum(size, (WEBP_MAX_PIXELS - 1) / dpi))
+            with timed("tight_layout"):
+                fig.tight_layout()
+        profile = dict(profile, dpi=dpi)
+    with timed("savefig", image=path) as record:
+        fig.savefig(path, facecolor="#f4f4f4", transparent=True, **profile)
+    record["bytes"] = os.path.getsize(path)
+
+
+def close_plot_templates():
+    """
+    Does: Closes the figures of all plot templates of this process. 
     Returns: 
-        xlabels (list)
+        None
     """
 
-    xlabels =[]
-    vecka = 21
-    for i in range(get_iMax(df)):
-        if df["Day"][i] == "måndag":
-            xlabels.append(df["Date"][i] + "\n Mån v: " + str(vecka))
-            vecka += 1
-    return xlabels
+    from matplotlib import pyplot as plt
+    for template in _templates.values():
+        plt.close(template["figure"])
+    _templates.clear()
 
 
-def create_group_data(df, groups, group):
+def create_group_data(df, groups, group, ctx=None, smoothed=False):
     """
     In: 
         df: All of the data (Pandas DataFrame)
-        groups: All of the groups (list)
+        groups: All of the groups, see get_group_weights (dict)
         group: Specific group (str)
-    Does: Creates y data for a specific group by taking the mean of group entries
+        ctx: Report context from prepare_report (dict)
+        smoothed: Returns the mean smoothed with sigma 1.7 instead (Boolean)
+    Does: Takes the weighted mean of the group entries from the context, or computes it with get_group_means 
+          when the context was prepared without this group. 
     Returns:
-        Pandas DataFrame 
+        Pandas Series 
     """
 
-    return df[groups[group]].mean(axis=1)[:get_iMax(df)]
+    ctx = ctx or prepare_report(df, groups=groups)
+    weights = get_group_weights({group: groups[group]})
+    means = ctx["group_means"] if ctx["groups"].get(group) == weights[group] else get_group_means(ctx["data"], weights)
+    return means[1 if smoothed else 0][group]
 
 
-def create_group_plot(df, attatchment_path, group, groups, show):
+def create_group_plot(df, attatchment_path, group, groups, show, ctx=None):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
         group: Specific group name (str)
-        groups: List of all group names (list)
+        groups: All of the groups, see get_group_weights (dict)
         show: Decides if plot is shown or not (Boolean)
+        ctx: Report context from prepare_report (dict)
     Does: Creates background and then plots all group entries and group mean
     Returns: 
-        None 
+        Path of the saved image (str)
     """
 
     # Load group data
-    group_data = create_group_data(df, groups, group)
-    x_values = df["Date"][:iMax]
+    ctx = ctx or prepare_report(df, groups=groups)
+    path = get_image_file(attatchment_path+"y_"+str(group)+"_plot", ctx)
+    weights = get_group_weights({group: groups[group]})[group]
+    if is_rendered(ctx, path, get_render_key(create_group_plot, ctx, list(weights), group, weights)) and not show:
+        return path
+    group_data = create_group_data(df, groups, group, ctx, smoothed=True)
 
-    # Initialize figure and plot, use cmap as background
-    iMax = get_iMax(df)
-    aspect = iMax/14
-    fig, line = plt.subplots(figsize=(8.8,5), sharex=True, sharey=True)
-    cmap = LinearSegmentedColormap.from_list('krg',["#008702","#7fe393", "#f4f4f4","#F6BCB6", "#B23131"], N=256)
-    line.imshow([[0,0],[1,1]], cmap=cmap, interpolation='bicubic', extent=[0,iMax,0.7,5.3], aspect=aspect)
-    
-    # Plot group members
-    linestyle = "-"
-    linecolor = "black"
-    for col in groups[group]:
-        y_values_col = gaussian_filter1d(df[col][:get_iMax(df)], sigma=1.7)
-        line.plot_date(x_values, y_values_col, linewidth="1", linestyle=linestyle, marker=None, label=col)
-    
-    # Plot group mean
-    y_values1 = gaussian_filter1d(group_data, sigma=1.7)
-    line.plot_date(x_values, y_values1, linewidth="3", color=linecolor, linestyle=linestyle, marker=None, label=group)
-    
-    # Plot configs
-    line.set_ylim(0.7, 5.3)
-    xlabels = get_xlabels(df)
-    line.set_xticks([df["Date"][i] for i in range(iMax) if df["Day"][i] == "måndag"])
-    line.set_xticks([df["Date"][i] for i in range(iMax) if df["Day"][i] != "måndag"], minor=True)
-    line.set_xticklabels(xlabels, rotation=90)
-    line.set_yticks([1,2,3,4,5])
-    line.tick_params(axis='y', which='major', labelsize=10)
-    line.grid(axis = "y", linestyle="-", color="darkgray")    
-    line.legend()
-    line.set_title(group) 
-    fig.tight_layout()
-    plt.savefig(attatchment_path+"y_"+str(group)+"_plot", facecolor="#f4f4f4", transparent=True, pad_inches=6, dpi=300)
-    
-    # Use show argument to decide wheter to plot or not 
-    if show: 
-        plt.show()
-    else: 
-        plt.clf()
+    # Group members in the color cycle, then the group mean
+    lines = [(ctx["smoothed"][1.7][col], {"linewidth": 1, "color": "C" + str(i), "label": col}) for i, col in enumerate(weights)]
+    lines.append((group_data, {"linewidth": 3, "color": "black", "label": group}))
+    draw_lines(get_plot_template(ctx, DATA_COLORS), ctx, lines, group, path, show)
+
+    return path
 
 
-def create_all_group_plots(df, attatchment_path, groups, show=False):
+def create_all_group_plots(df, attatchment_path, groups, show=False, ctx=None, workers=1):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
-        groups: List of all group names (list)
+        groups: All of the groups, see get_group_weights (dict)
         show: Decides if plot is shown or not (Boolean)
+        ctx: Report context from prepare_report (dict)
+        workers: Number of processes to render in, ignored when show is True (int)
     Does: Calls create_group_plot on every group.
     Returns: 
         None 
     """
 
-    for group in groups.keys():
-        create_group_plot(df, attatchment_path, group, groups, show)
+    ctx = ctx or prepare_report(df, groups=groups)
+    jobs = [(create_group_plot, (attatchment_path, group, groups, show), {}) for group in groups.keys()]
+    run_plot_jobs(jobs, ctx, 1 if show else workers)
 
 
-def compare_plot(df, attatchment_path, column1, column2):
+def compare_plot(df, attatchment_path, column1, column2, ctx=None, folder="plotcomp"):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
         column1, column2: Two of: Average, Experience, Harmony, Social, Motivation, Physique, Creativity, \
                                   ER, Diet, Discipline, Sleep, Productivity, Meditation, Training&Strech (str)
+        ctx: Report context from prepare_report (dict)
+        folder: Subfolder of attatchment_path for the plot, created if missing (str)
     Does: Creates a plot with two different columns. 
     Returns: 
-        None     
+        Path of the saved image (str)
     """
 
     # Init
-    iMax = get_iMax(df)
-    cmap = LinearSegmentedColormap.from_list('krg',["#31B247","#B6F6BE", "#f4f4f4","#F6BCB6", "#B23131"], N=256)
-    fig, line = plt.subplots(figsize=(8.8,5), sharex=True, sharey=True)
-    line.imshow([[0,0],[1,1]], cmap=cmap, interpolation='bicubic', extent=[0,iMax,0.7,5.3], aspect=iMax/14)
+    ctx = ctx or prepare_report(df)
+    path = get_image_file(os.path.join(attatchment_path, folder, str(column1)+ "_and_" + str(column2) +"_plot"), ctx)
+    if is_rendered(ctx, path, get_render_key(compare_plot, ctx, [column1, column2])):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
     # Get axis valeues and plot the two lines
-    x_values = df["Date"][:get_iMax(df)]
-    y_values1, y_values2 = get_y(df, column1, column2)
-    line.plot_date(x_values, y_values1, linewidth="2", color="black", linestyle="-", marker=None, label=column1)
-    line.plot_date(x_values, y_values2, linewidth="2", color="blue", linestyle="-", marker=None, label=column2)
+    y_values1, y_values2 = get_y(df, column1, column2, ctx)
+    lines = [(y_values1, {"linewidth": 2, "color": "black", "label": column1}),
+             (y_values2, {"linewidth": 2, "color": "blue", "label": column2})]
+    draw_lines(get_plot_template(ctx, COMPARE_COLORS), ctx, lines, column1 + " & " + column2, path)
+    return path
 
-    # Plot configs
-    line.set_ylim(0.7, 5.3)
-    xlabels =[]
-    vecka = 21
-    for i in range(get_iMax(df)):
-        if df["Day"][i] == "måndag":
-            xlabels.append(df["Date"][i] + "\n Mån v: " + str(vecka))
-            vecka += 1
-    line.set_xticks([df["Date"][i] for i in range(get_iMax(df)) if df["Day"][i] == "måndag"])
-    line.set_xticks([df["Date"][i] for i in range(get_iMax(df)) if df["Day"][i] != "måndag"], minor=True)
-    line.set_xticklabels(xlabels, rotation=90)
-    line.set_yticks([1,2,3,4,5])
-    line.tick_params(axis='y', which='major', labelsize=10)
-    line.grid(axis = "y", linestyle="-", color="darkgray")
-    line.legend()
-    line.set_title(column1 + " & " + column2) 
-    fig.tight_layout()
-    fig.savefig(attatchment_path+ "/plotcomp/"+str(column1)+ "_and_" + str(column2) +"_plot", facecolor="#f4f4f4", transparent=True, pad_inches=6, dpi=300)
 
+def get_compare_jobs(attatchment_path, ctx, top=None, folder="plotcomp"):
+    """
+    In: 
+        attatchment_path: Path where plots will be saved (str)
+        ctx: Report context from prepare_report (dict)
+        top: Number of most correlated pairs, None takes all pairs (int)
+        folder: Subfolder of attatchment_path for the plots (str)
+    Returns: 
+        compare_plot jobs for run_plot_jobs, most correlated pair first (list of tuples)
+    """
+
+    column1, column2, _ = get_correlation_pairs(ctx["data"], top)
+    return [(compare_plot, (attatchment_path, a, b), {"folder": folder}) for a, b in zip(column1[::-1], column2[::-1])]
 
-def create_data_plot(df, column, attatchment_path, show=False):
+
+def create_all_compare_plots(df, attatchment_path, ctx=None, top=None, workers=1, folder="plotcomp"):
+    """
+    In: 
+        df: All of the data (Pandas DataFrame)
+        attatchment_path: Path where plots will be saved (str)
+        ctx: Report context from prepare_report (dict)
+        top: Number of most correlated pairs to plot, None plots all pairs (int)
+        workers: Number of processes to render in (int)
+        folder: Subfolder of attatchment_path for the plots (str)
+    Does: Calls compare_plot on the most correlated pairs. With a render cache only the pairs whose data 
+          changed are drawn again. 
+    Returns: 
+        Paths of the images, most correlated pair first (list)
+    """
+
+    ctx = ctx or prepare_report(df)
+    return run_plot_jobs(get_compare_jobs(attatchment_path, ctx, top, folder), ctx, workers)
+
+
+def create_data_plot(df, column, attatchment_path, show=False, ctx=None):
     """
     In: 
         df: All of the data (Pandas DataFrame)
@@ -258,147 +1358,244 @@ def create_data_plot(df, column, attatchment_path, show=False):
             Average, Experience, Harmony, Social, Motivation, Physique, Creativity, 
             ER, Diet, Discipline, Sleep, Productivity, Meditation, Training&Strech (str)
         show: Decides if plot is shown or not (Boolean) 
+        ctx: Report context from prepare_report (dict)
     Does: Creates a plot with the column. 
     Returns: 
-        None  
+        Path of the saved image (str)
     """
 
     # Initalize figure and plot, background cmap definined manually 
-    iMax = get_iMax(df)
-    aspect = iMax/14
-    fig, line = plt.subplots(figsize=(8.8,5), sharex=True, sharey=True)
-    cmap = LinearSegmentedColormap.from_list('krg',["#008702","#7fe393", "#f4f4f4","#F6BCB6", "#B23131"], N=256)
-    line.imshow([[0,0],[1,1]], cmap=cmap, interpolation='bicubic', extent=[0,iMax,0.7,5.3], aspect=aspect)
-    
+    ctx = ctx or prepare_report(df)
+    path = get_image_file(attatchment_path+str(column)+"_plot", ctx)
+    if is_rendered(ctx, path, get_render_key(create_data_plot, ctx, [column])) and not show:
+        return path
+
     # Prepare data
-    x_values = df["Date"][:iMax]
-    y_values1 = gaussian_filter1d(df[column][:iMax], sigma=1.7)
-    y_values2 = gaussian_filter1d(df[column][:iMax], sigma=1)
-    y_values3 = df[column][:iMax]
+    y_values3 = ctx["data"][column]
+    y_values1 = ctx["smoothed"][1.7][column]
+    y_values2 = ctx["smoothed"][1][column]
 
     # Plot the data 
-    linestyle = "-"
-    line.plot_date(x_values, y_values2, linewidth="1", color="gray", linestyle=linestyle, marker=None)
-    line.plot_date(x_values, y_values3, linewidth="0.5", color="lightgray", linestyle=linestyle, marker=None)
-    line.plot_date(x_values, y_values1, linewidth="3", color="black", linestyle=linestyle, marker=None)
-    line.plot_date(x_values, df[column][:iMax], "kx", color="#494949" ,label=column)
+    lines = [(y_values2, {"linewidth": 1, "color": "gray"}),
+             (y_values3, {"linewidth": 0.5, "color": "lightgray"}),
+             (y_values1, {"linewidth": 3, "color": "black"}),
+             (y_values3, {"linewidth": 1.5, "linestyle": "None", "marker": "x", "color": "#494949", "label": column})]
+    draw_lines(get_plot_template(ctx, DATA_COLORS), ctx, lines, column, path, show)
 
-    # Plot configurations
-    line.set_ylim(0.7, 5.3)
-    xlabels = get_xlabels(df)
-    line.set_xticks([df["Date"][i] for i in range(iMax) if df["Day"][i] == "måndag"])
-    line.set_xticks([df["Date"][i] for i in range(iMax) if df["Day"][i] != "måndag"], minor=True)
-    line.set_xticklabels(xlabels, rotation=90)
-    line.set_yticks([1,2,3,4,5])
-    line.tick_params(axis='y', which='major', labelsize=10)
-    line.grid(axis = "y", linestyle="-", color="darkgray")    
-    line.legend()
-    line.set_title(column) 
-    fig.tight_layout()
-    plt.savefig(attatchment_path+str(column)+"_plot", facecolor="#f4f4f4", transparent=True, pad_inches=6, dpi=300)
-   
-    # Use show argument to decide wheter to plot or not 
-    if show: 
-        plt.show()
-    else: 
-        plt.clf()
+    return path
 
 
-def create_all_data_plots(df, attatchment_path, show=False):
+def create_all_data_plots(df, attatchment_path, show=False, ctx=None, workers=1):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
         show: Decides if plot is shown or not (Boolean)
+        ctx: Report context from prepare_report (dict)
+        workers: Number of processes to render in, ignored when show is True (int)
     Does: Calls create_data_plot on all columns. 
     Returns: 
         None 
     """
 
     # Use create_data_plot on all 
-    for column in remove_string_columns(df):
-        create_data_plot(df, column, attatchment_path, show)
+    ctx = ctx or prepare_report(df)
+    jobs = [(create_data_plot, (column, attatchment_path, show), {}) for column in ctx["data"]]
+    run_plot_jobs(jobs, ctx, 1 if show else workers)
 
 
-def rank_columns_std_plot(df, attatchment_path, show=False):
+def rank_columns_std_plot(df, attatchment_path, show=False, ctx=None, windows=()):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
         show: Decides if plot is shown or not (Boolean)
+        ctx: Report context from prepare_report (dict)
+        windows: Numbers of last days to add a bar for next to all of history, like (7, 30, 90) (tuple)
     Does: Creates a plot with all stds of all columns. 
     Returns: 
-        None     
+        Path of the saved image (str)
     """
 
     # Plot 
+    ctx = ctx or prepare_report(df)
+    path = get_image_file(attatchment_path+"z_std"+"_plot", ctx)
+    if is_rendered(ctx, path, get_render_key(rank_columns_std_plot, ctx, ctx["data"].columns, windows)) and not show:
+        return path
+    from matplotlib import pyplot as plt
     fig, line = plt.subplots(figsize=(8.8,6), sharex=True, sharey=True)
-    line.bar(remove_string_columns(df).columns, df[0:get_iMax(df)].std(), label = "Standard Deviation")
+    plot_stat_bars(line, ctx, "std", windows, label = "Standard Deviation")
     line.grid(axis = "y", linestyle="-", color="darkgray")
     line.legend()
     line.set_ylim(0, 2)
     line.tick_params(axis='x', labelrotation=90)
     line.set_facecolor("#F4F4F4")
     fig.set_facecolor("white")
-    fig.tight_layout()
+    with timed("tight_layout"):
+        fig.tight_layout()
     line.set_title("Standard deviations") 
-    fig.savefig(attatchment_path+"z_std"+"_plot", facecolor="#f4f4f4", transparent=True, pad_inches=6, dpi=300)
+    save_plot(fig, path, ctx)
     
     # Use show argument to decide wheter to plot or not 
     if show: 
         plt.show()
     else: 
-        plt.clf()
+        plt.close(fig)
+
+    return path
 
 
-def rank_columns_mean_plot(df, attatchment_path, show=False):
+def rank_columns_mean_plot(df, attatchment_path, show=False, ctx=None, windows=()):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
         show: Decides if plot is shown or not (Boolean)
+        ctx: Report context from prepare_report (dict)
+        windows: Numbers of last days to add a bar for next to all of history, like (7, 30, 90) (tuple)
     Does: Creates a plot with all means of all columns. 
     Returns: 
-        None     
+        Path of the saved image (str)
     """
 
     #Plot figure 
+    ctx = ctx or prepare_report(df)
+    path = get_image_file(attatchment_path+"z_means"+"_plot", ctx)
+    if is_rendered(ctx, path, get_render_key(rank_columns_mean_plot, ctx, ctx["data"].columns, windows)) and not show:
+        return path
+    from matplotlib import pyplot as plt
     fig, line = plt.subplots(figsize=(8.8,6), sharex=True, sharey=True)
-    line.bar(remove_string_columns(df).columns, df[0:get_iMax(df)].mean(), label = "Mean", color="green")
+    plot_stat_bars(line, ctx, "mean", windows, label = "Mean", color="green")
     line.grid(axis = "y", linestyle="-", color="darkgray")
     line.legend()
     line.set_ylim(0.7, 5.3)
     line.tick_params(axis='x', labelrotation=90)
     line.set_facecolor("#F4F4F4")
     fig.set_facecolor("white")
-    fig.tight_layout()
+    with timed("tight_layout"):
+        fig.tight_layout()
     line.set_title("Means") 
-    fig.savefig(attatchment_path+"z_means"+"_plot", facecolor="#f4f4f4", transparent=True, pad_inches=6, dpi=300)
+    save_plot(fig, path, ctx)
     
     # Use show argument to decide wheter to plot or not     
     if show: 
         plt.show()
     else: 
-        plt.clf()
+        plt.close(fig)
+
+    return path
+
 
+# Bars of the last days in the mean and std plots, not green like the mean bars
+WINDOW_COLORS = ("C0", "C1", "C4", "C9", "C6")
 
-def rank_columns_correlation_plot(df, attatchment_path, show=False):
+
+def plot_stat_bars(line, ctx, stat, windows, **properties):
+    """
+    In: 
+        line: Axes to draw on (matplotlib Axes)
+        ctx: Report context from prepare_report (dict)
+        stat: "mean" or "std" (str)
+        windows: Numbers of last days to add a bar for, none gives one bar per column (tuple)
+        properties: Bar properties of the bars for all of history (dict)
+    Does: Draws the statistic of every column, labeled by the index of the statistics themselves. 
+    Returns: 
+        None
+    """
+
+    values = ctx["stats"][stat]
+    if not windows:
+        line.bar(values.index, values, **properties)
+        return
+    window_values = get_window_stats(ctx["data"], windows)[stat]
+    width = 0.8 / (len(windows) + 1)
+    x = np.arange(len(values)) - 0.4 + width / 2
+    line.bar(x, values, width, **properties)
+    for i, window in enumerate(windows):
+        line.bar(x + (i + 1) * width, window_values.loc[window, values.index], width, label="Last " + str(window) + " days", \
+                 color=WINDOW_COLORS[i % len(WINDOW_COLORS)])
+    line.set_xticks(np.arange(len(values)), values.index)
+
+
+def rank_correlations(data, top=None, threshold=None):
+    """
+    In: 
+        data: Numeric data (Pandas DataFrame)
+        top: Number of strongest correlations to keep, None keeps all (int)
+        threshold: Smallest absolute correlation to keep, None keeps all (float)
+    Returns: 
+        Absolute correlations labeled "column1, column2", weakest first (Pandas Series)
+    """
+
+    column1, column2, values = get_correlation_pairs(data, top, threshold)
+    return pd.Series(values, index=[a + ", " + b for a, b in zip(column1, column2)])
+
+
+def get_correlation_pairs(data, top=None, threshold=None):
+    """
+    In: 
+        data: Numeric data (Pandas DataFrame)
+        top: Number of strongest correlations to keep, None keeps all (int)
+        threshold: Smallest absolute correlation to keep, None keeps all (float)
+    Does: Takes every pair of columns once from the upper triangle of the correlation matrix. 
+    Returns: 
+        First columns, second columns and absolute correlations, weakest first (tuple of numpy arrays)
+    """
+
+    # Pairwise complete sums from matrix products, like data.corr() but without a loop over the pairs
+    valid = data.notna().to_numpy(dtype=float)
+    x = np.nan_to_num(data.to_numpy(dtype=float))
+    n = valid.T @ valid
+    sx = x.T @ valid
+    sxx = (x * x).T @ valid
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = x.T @ x - sx * sx.T / n
+        var = sxx - sx * sx / n
+        corr = np.abs(cov / np.sqrt(var * var.T))
+    rows, cols = np.triu_indices(len(corr), k=1)
+    values = corr[rows, cols]
+    keep = ~np.isnan(values)
+    if threshold is not None:
+        keep &= values >= threshold
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+    if top is not None and top < len(values):
+        best = np.argpartition(values, len(values) - top)[len(values) - top:]
+        rows, cols, values = rows[best], cols[best], values[best]
+    order = np.argsort(values, kind="stable")
+    names = data.columns.to_numpy()
+    return names[rows[order]], names[cols[order]], values[order]
+
+
+# Correlations plotted when no top is given, all pairs of 200 metrics would be 19900 bars
+MAX_CORRELATIONS = 200
+
+
+def rank_columns_correlation_plot(df, attatchment_path, show=False, ctx=None, top=None, threshold=None):
     """
     In: 
         df: All of the data (Pandas DataFrame)
         attatchment_path: Path where plots will be saved (str)
         show: Decides if plot is shown or not (Boolean)
+        ctx: Report context from prepare_report (dict)
+        top: Number of strongest correlations to plot, None plots the MAX_CORRELATIONS strongest (int)
+        threshold: Smallest absolute correlation to plot, None plots all (float)
     Does: Creates a plot with all correlations.  
     Returns: 
-        None     
+        Path of the saved image (str)
     """
 
-    # Get the correlation data and remove duplicates. 
-    so = df[0:get_iMax(df)].corr().abs().unstack().sort_values(kind="quicksort").drop_duplicates()[:-1]
-    x = [so.index[i][0] + ", " + so.index[i][1] for i in range(len(so.index))]
+    # Get the correlation of every pair once
+    ctx = ctx or prepare_report(df)
+    top = MAX_CORRELATIONS if top is None else top
+    path = get_image_file(attatchment_path+"z_correlations"+"_plot", ctx)
+    if is_rendered(ctx, path, get_render_key(rank_columns_correlation_plot, ctx, ctx["data"].columns, top, threshold)) and not show:
+        return path
+    from matplotlib import pyplot as plt
+    so = rank_correlations(ctx["data"], top, threshold)
+    x = so.index
 
-    #Create plot 
-    fig, line = plt.subplots(figsize=(50,10), sharex=True, sharey=True)
+    #Create plot, about 0.55 inch per bar
+    fig, line = plt.subplots(figsize=(max(8.8, 0.55*len(so)),10), sharex=True, sharey=True)
     line.bar(x, so, label = "Correlations", color="lightblue", edgecolor="black")
     for i, v in enumerate(so):
         line.text(i-0.3, v+0.03, "- "+  str(round(v,4)), fontweight="bold", color='black', rotation=90)
@@ -410,11 +1607,14 @@ def rank_columns_correlation_plot(df, attatchment_path, show=False):
     line.set_facecolor("#F4F4F4")
     fig.set_facecolor("white")
     line.set_title("Correlations") 
-    fig.tight_layout()
-    fig.savefig(attatchment_path+"z_correlations"+"_plot", facecolor="#f4f4f4", transparent=True, pad_inches=6, dpi=300)
+    with timed("tight_layout"):
+        fig.tight_layout()
+    save_plot(fig, path, ctx)
     
     # Use show argument to decide wheter to plot or not 
     if show: 
         plt.show()
     else: 
-        plt.clf()
+        plt.close(fig)
+
+    return path
@@ -0,0 +1,225 @@
+# Mail functions
+import smtplib
+import base64
+import os
+import json
+import tempfile
+import secrets
+import mimetypes
+from html import escape
+from email.mime.text import MIMEText
+
+# Bytes read per base64 chunk, a multiple of 57 so every chunk ends on a full 76 character line
+CHUNK = 57 * 1024
+
+# Largest message kept in memory before it is spooled to disk
+SPOOL_SIZE = 1024 * 1024
+
+
+def write_report_message(sender, to, subject, body, attachments, bcc=None):
+    """
+    In:
+        sender: Address the mail is from (str)
+        to: Address or addresses for the To header (str or list)
+        subject: Subject of the mail (str)
+        body: Plain text of the mail (str)
+        attachments: Paths of the files to attach (list)
+        bcc: Address or addresses for the Bcc header, no header if None (str or list)
+    Does: Writes the multipart message to a temporary file, base64-encoding one chunk of an attachment at a time.
+          Only the file on disk grows with the attachments, not the memory.
+    Returns:
+        The message, positioned at the start (file object, close it when sent)
+    """
+
+    message = start_report_message(sender, to, subject, bcc)
+    for path in attachments:
+        add_attachment(message, path)
+    return finish_report_message(message, body)
+
+
+def write_html_report_message(sender, to, subject, body, images, bcc=None):
+    """
+    In:
+        sender: Address the mail is from (str)
+        to: Address or addresses for the To header (str or list)
+        subject: Subject of the mail (str)
+        body: Plain text above the images (str)
+        images: Paths of the images, in the order they are shown (list)
+        bcc: Address or addresses for the Bcc header, no header if None (str or list)
+    Does: Writes one HTML mail that shows the images in its body. The images are inline parts referenced
+          by Content-ID, written to the temporary file one chunk at a time like write_report_message.
+    Returns:
+        The message, positioned at the start (file object, close it when sent)
+    """
+
+    message = start_report_message(sender, to, subject, bcc, "related")
+    ids = [secrets.token_hex(8) + "@journal_report" for _ in images]
+    html = "<p>" + escape(body).replace("\n", "<br>") + "</p>\n" + "".join(
+        '<p><img src="cid:' + cid + '" alt="' + escape(os.path.basename(path)) + '" style="max-width:100%"></p>\n'
+        for cid, path in zip(ids, images))
+    message.write(("--" + message.boundary + "\n").encode())
+    message.write(MIMEText(html, "html").as_bytes() + b"\n")
+    for cid, path in zip(ids, images):
+        add_attachment(message, path, cid)
+    message.write(("--" + message.boundary + "--\n").encode())
+    message.seek(0)
+    return message
+
+
+def start_report_message(sender, to, subject, bcc=None, subtype="mixed"):
+    """
+    In:
+        sender: Address the mail is from (str)
+        to: Address or addresses for the To header (str or list)
+        subject: Subject of the mail (str)
+        bcc: Address or addresses for the Bcc header, no header if None (str or list)
+        subtype: Multipart subtype, related for a HTML body with inline images (str)
+    Does: Writes the headers of a multipart message to a temporary file. Attachments can then be added
+          one by one with add_attachment, for example as soon as they are rendered.
+    Returns:
+        The message, finish it with finish_report_message (file object)
+    """
+
+    message = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    message.boundary = "===============" + secrets.token_hex(16)
+    headers = [
+        'Content-Type: multipart/' + subtype + '; boundary="' + message.boundary + '"',
+        "MIME-Version: 1.0",
+        "From: " + sender,
+        "To: " + get_addresses(to),
+        "Subject: " + subject,
+    ]
+    if bcc is not None:
+        headers.append("Bcc: " + get_addresses(bcc))
+    message.write(("\n".join(headers) + "\n\n").encode())
+    return message
+
+
+def add_attachment(message, path, cid=None):
+    """
+    In:
+        message: Message from start_report_message (file object)
+        path: Path of the file to attach, named by its file name (str)
+        cid: Content-ID to show the file inline in a HTML body, None attaches it (str)
+    Does: Appends the file as a base64 part with the type of its extension, one chunk at a time.
+    Returns:
+        None
+    """
+
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    disposition = "attachment" if cid is None else "inline"
+    message.write(("--" + message.boundary + "\n"
+                   "Content-Type: " + content_type + "\n"
+                   "MIME-Version: 1.0\n"
+                   "Content-Transfer-Encoding: base64\n"
+                   + ("" if cid is None else "Content-ID: <" + cid + ">\n") +
+                   "Content-Disposition: " + disposition + '; filename="' + os.path.basename(path) + '"\n\n').encode())
+    with open(path, "rb") as attachment:
+        for chunk in iter(lambda: attachment.read(CHUNK), b""):
+            message.write(base64.encodebytes(chunk))
+
+
+def finish_report_message(message, body):
+    """
+    In:
+        message: Message from start_report_message (file object)
+        body: Plain text of the mail (str)
+    Does: Appends the body as the last part and closes the multipart message.
+    Returns:
+        The message, positioned at the start (file object, close it when sent)
+    """
+
+    message.write(("--" + message.boundary + "\n").encode())
+    message.write(MIMEText(body, "plain").as_bytes())
+    message.write(("\n--" + message.boundary + "--\n").encode())
+    message.seek(0)
+    return message
+
+
+def get_report_attachments(attatchment_path):
+    """
+    In:
+        attatchment_path: Path where the plots were saved (str)
+    Does: Reads the render manifest that report_functions.close_render_cache wrote, so exactly the images
+          of the last render are attached, in whatever format and subfolder they were saved.
+    Returns:
+        Paths of the images, sorted (list)
+    """
+
+    with open(os.path.join(attatchment_path, "render_manifest.json")) as f:
+        return sorted(image for image in json.load(f) if os.path.exists(image))
+
+
+def get_addresses(addresses):
+    """
+    In:
+        addresses: One address or a list of addresses (str or list)
+    Returns:
+        Addresses for a header (str)
+    """
+
+    return addresses if isinstance(addresses, str) else ", ".join(addresses)
+
+
+def open_smtp(host, port, user, password, context=None):
+    """
+    In:
+        host, port: SMTP server with implicit TLS (str, int)
+        user, password: Login of the sender (str)
+        context: TLS settings, None uses smtplib's default (ssl.SSLContext)
+    Does: Connects and logs in once, so several reports can be sent over the same connection.
+    Returns:
+        Logged in connection, use it in a with block (smtplib.SMTP_SSL)
+    """
+
+    server = smtplib.SMTP_SSL(host, port, context=context)
+    server.login(user, password)
+    return server
+
+
+def send_report(server, sender, recipients, message):
+    """
+    In:
+        server: Logged in connection from open_smtp (smtplib.SMTP)
+        sender: Envelope sender (str)
+        recipients: Envelope recipients (str or list)
+        message: Message from write_report_message (file object)
+    Does: Sends the message line by line, with CRLF line endings and dot-stuffing, so it is never
+          held in memory as a whole. Can be called again on the same connection for other recipients
+          or report variants.
+    Returns:
+        None
+    """
+
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    server.ehlo_or_helo_if_needed()
+    code, reply = server.mail(sender)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, reply, sender)
+    refused = {}
+    for recipient in recipients:
+        code, reply = server.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, reply)
+    if len(refused) == len(recipients):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, reply = server.docmd("data")
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, reply)
+    message.seek(0)
+    lines = []
+    for line in message:
+        line = line.rstrip(b"\r\n")
+        lines.append(b"." + line if line.startswith(b".") else line)
+        if len(lines) == 1024:
+            server.sock.sendall(b"\r\n".join(lines) + b"\r\n")
+            lines = []
+    server.sock.sendall(b"\r\n".join(lines + [b"."]) + b"\r\n")
+    code, reply = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, reply)
@@ -0,0 +1,160 @@
+# Timing functions
+#
+# Every timed block adds one record to the timings of this process. Render workers send theirs back with
+# each image, see report_functions._render_job. write_timings saves the records of a run as JSON or as a
+# Prometheus textfile.
+import os
+import json
+import time
+import types
+import inspect
+import functools
+from contextlib import contextmanager
+
+# Records of this process since the last pop_timings, appending to a list is safe from several threads
+_timings = []
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    In:
+        stage: Name of what is timed (str)
+        labels: Extra fields of the record, like the image (str)
+    Does: Times the block and adds the record to the timings, also when the block raises. The block can
+          add fields to the record it gets, like the size of a saved file.
+    Returns:
+        The record (dict)
+    """
+
+    record = dict(labels, stage=stage)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        _timings.append(record)
+
+
+def timed_function(function, stage=None):
+    """
+    In:
+        function: Function to time (function)
+        stage: Name of the records, the function name if None (str)
+    Returns:
+        Function that times every call, the original is in __wrapped__ (function)
+    """
+
+    stage = stage or function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with timed(stage):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def instrument(module):
+    """
+    In:
+        module: Module to time, like report_functions (module)
+    Does: Replaces every public function of the module, except the async ones, with a timed one, once.
+          Calls between the functions go through the module globals, so they are timed too. Render
+          workers started afterwards inherit the timed functions.
+    Returns:
+        None
+    """
+
+    for name, function in list(vars(module).items()):
+        if isinstance(function, types.FunctionType) and not name.startswith("_") \
+           and function.__module__ == module.__name__ and not hasattr(function, "__wrapped__") \
+           and not inspect.isasyncgenfunction(function) and not inspect.iscoroutinefunction(function):
+            setattr(module, name, timed_function(function, module.__name__ + "." + name))
+
+
+def add_timings(records):
+    """
+    In:
+        records: Records from another process (list of dicts)
+    Returns:
+        None
+    """
+
+    _timings.extend(records)
+
+
+def pop_timings():
+    """
+    Returns:
+        Records of this process since the last call, which are removed (list of dicts)
+    """
+
+    records = _timings[:]
+    del _timings[:len(records)]
+    return records
+
+
+def summarize_timings(records):
+    """
+    In:
+        records: Records from pop_timings (list of dicts)
+    Returns:
+        Calls, total and largest seconds per stage (dict)
+    """
+
+    stages = {}
+    for record in records:
+        stage = stages.setdefault(record["stage"], {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+        stage["calls"] += 1
+        stage["seconds"] += record["seconds"]
+        stage["max_seconds"] = max(stage["max_seconds"], record["seconds"])
+    return stages
+
+
+def write_timings(path, records=None):
+    """
+    In:
+        path: File to write, a .prom file is a Prometheus textfile, anything else JSON (str)
+        records: Records to write, pop_timings() if None (list of dicts)
+    Does: Writes a summary per stage, and for JSON also every record. The file is replaced at once, so a
+          collector never reads half of it.
+    Returns:
+        None
+    """
+
+    records = pop_timings() if records is None else records
+    stages = summarize_timings(records)
+    if path.endswith(".prom"):
+        text = get_prometheus_text(stages, records)
+    else:
+        text = json.dumps({"time": time.time(), "stages": stages, "records": records}, indent=1, default=str)
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def get_prometheus_text(stages, records):
+    """
+    In:
+        stages: Summary from summarize_timings (dict)
+        records: Records of the run, the ones with bytes give the image sizes (list of dicts)
+    Returns:
+        Metrics in the Prometheus text format (str)
+    """
+
+    def label(value):
+        return '"' + str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+
+    lines = ["# HELP journal_report_stage_seconds Seconds spent in each stage of the last run.",
+             "# TYPE journal_report_stage_seconds gauge"]
+    lines += ["journal_report_stage_seconds{stage=%s} %f" % (label(stage), s["seconds"]) for stage, s in stages.items()]
+    lines += ["# HELP journal_report_stage_calls Times each stage ran in the last run.",
+              "# TYPE journal_report_stage_calls gauge"]
+    lines += ["journal_report_stage_calls{stage=%s} %d" % (label(stage), s["calls"]) for stage, s in stages.items()]
+    lines += ["# HELP journal_report_image_bytes Size of each image saved in the last run.",
+              "# TYPE journal_report_image_bytes gauge"]
+    lines += ["journal_report_image_bytes{image=%s} %d" % (label(r["image"]), r["bytes"]) for r in records if "bytes" in r]
+    lines += ["# HELP journal_report_last_run_seconds Unix time the timings were written.",
+              "# TYPE journal_report_last_run_seconds gauge",
+              "journal_report_last_run_seconds %f" % time.time()]
+    return "\n".join(lines) + "\n"
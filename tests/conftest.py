@@ -0,0 +1,14 @@
+# Shared test setup
+#
+# Usage: python -m pytest tests
+# Puts the repo and the benchmarks on the path, so the tests import the modules and the synthetic
+# journal the same way the scripts do.
+
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import matplotlib
+matplotlib.use("Agg")
@@ -0,0 +1,39 @@
+# Tests of the alerts in the mail body
+
+import numpy as np
+import pandas as pd
+
+from report_functions import get_alerts, get_alert_text
+
+
+def get_ctx(columns):
+    data = pd.DataFrame(columns, dtype=np.float32)
+    return {"data": data, "smoothed": {1.7: data}}
+
+
+def test_outlier():
+    rng = np.random.default_rng(0)
+    ctx = get_ctx({"Sleep": list(rng.normal(3, 0.5, 40)) + [6], "Diet": list(rng.normal(3, 0.5, 41))})
+    alerts = get_alerts(ctx)
+    assert list(alerts.loc[alerts["alert"] == "outlier", "metric"]) == ["Sleep"]
+
+
+def test_flat_baseline():
+    ctx = get_ctx({"Sleep": [3] * 40 + [1], "Diet": [3] * 41})
+    alerts = get_alerts(ctx)
+    outliers = alerts[alerts["alert"] == "outlier"]
+    assert list(outliers["metric"]) == ["Sleep"]
+    assert np.isfinite(outliers["value"]).all()
+    assert "Sleep 4.0σ below its 30 day mean" in get_alert_text(alerts)
+
+
+def test_short_baseline():
+    ctx = get_ctx({"Sleep": [3, 4, 1], "Diet": [2, 2, 5]})
+    assert get_alerts(ctx)["alert"].isin(["outlier", "shift"]).sum() == 0
+
+
+def test_sparse_baseline():
+    values = [np.nan] * 35 + [3, 4, 3, 4, 3] + [1]
+    ctx = get_ctx({"Sleep": values})
+    assert "outlier" not in set(get_alerts(ctx)["alert"])
+    assert "outlier" in set(get_alerts(ctx, min_count=5)["alert"])
@@ -0,0 +1,42 @@
+# Tests of the saved plots
+
+import types
+
+import numpy as np
+from matplotlib import pyplot as plt
+from PIL import Image
+
+import report_functions
+from report_functions import MAX_CORRELATIONS, MIN_DPI, WEBP_MAX_PIXELS, int_columns, prepare_report, save_plot, \
+                             rank_columns_correlation_plot, create_data_plot
+from report_timing import instrument
+from synthetic import get_sheet_rows
+
+
+def test_wide_webp_keeps_min_dpi(tmp_path):
+    fig = plt.figure(figsize=(400, 5))
+    fig.add_subplot().plot(np.arange(10))
+    path = str(tmp_path / "wide.webp")
+    save_plot(fig, path, {"profile": "email"})
+    plt.close(fig)
+    width, height = Image.open(path).size
+    assert width <= WEBP_MAX_PIXELS and height == 5 * MIN_DPI
+
+
+def test_correlations_are_capped(tmp_path):
+    ctx = prepare_report(int_columns(get_sheet_rows(1, 25)), profile="email")
+    path = rank_columns_correlation_plot(None, str(tmp_path) + "/", ctx=ctx)
+    width, height = Image.open(path).size
+    assert 25 * 24 // 2 > MAX_CORRELATIONS
+    assert width <= WEBP_MAX_PIXELS and height == 10 * 110
+
+
+def test_render_key_is_the_same_with_timings(monkeypatch):
+    ctx = prepare_report(int_columns(get_sheet_rows(1)), profile="email")
+    key = report_functions.get_render_key(create_data_plot, ctx, ["Sleep"])
+    for name, function in list(vars(report_functions).items()):
+        if isinstance(function, types.FunctionType):
+            monkeypatch.setattr(report_functions, name, function) # Put back after the test
+    instrument(report_functions)
+    assert hasattr(report_functions.smooth_data, "__wrapped__")
+    assert report_functions.get_render_key(report_functions.create_data_plot, ctx, ["Sleep"]) == key
@@ -0,0 +1,37 @@
+# Tests of rendering the plots in a shared pool of worker processes
+
+import asyncio, os
+
+from report_functions import int_columns, prepare_report, open_render_pool, run_plot_jobs, stream_plot_jobs, \
+                             rank_columns_mean_plot, create_data_plot
+from synthetic import get_sheet_rows
+
+
+def get_jobs(folder):
+    return [(rank_columns_mean_plot, (folder,), {}), (create_data_plot, ("Sleep", folder), {})]
+
+
+def read(images):
+    images = sorted(images)
+    return [os.path.basename(image) for image in images], [open(image, "rb").read() for image in images]
+
+
+def test_shared_pool_renders_each_report_with_its_own_data(tmp_path):
+    reports = [prepare_report(int_columns(get_sheet_rows(1, seed=seed)), profile="email-png") for seed in (0, 1)]
+    expected = []
+    for i, ctx in enumerate(reports):
+        os.makedirs(tmp_path / ("local" + str(i)))
+        expected.append(read(run_plot_jobs(get_jobs(str(tmp_path / ("local" + str(i))) + "/"), ctx)))
+    assert expected[0][1] != expected[1][1]
+
+    with open_render_pool(2) as pool:
+        for i, ctx in enumerate(reports * 2):
+            folder = str(tmp_path / ("pool" + str(i))) + "/"
+            os.makedirs(folder)
+            assert read(run_plot_jobs(get_jobs(folder), ctx, pool=pool)) == expected[i % 2]
+
+        async def stream(folder):
+            return [image async for image in stream_plot_jobs(get_jobs(folder), reports[1], pool=pool)]
+
+        os.makedirs(tmp_path / "stream")
+        assert read(asyncio.run(stream(str(tmp_path / "stream") + "/"))) == expected[1]
@@ -0,0 +1,13 @@
+# Tests of the report context
+
+from report_functions import int_columns, prepare_report
+from synthetic import get_sheet_rows
+
+
+def test_gaps_keep_the_last_entries():
+    rows = get_sheet_rows(1, gaps=0.1, future=5)
+    ctx = prepare_report(int_columns(rows))
+    last = rows.index[rows["Journal"] != ""][-1]
+    assert ctx["iMax"] == last + 1 < len(rows)
+    assert ctx["dates"][-1].date().isoformat() == rows["Date"].iloc[last]
+    assert (rows["Journal"].iloc[:ctx["iMax"]] == "").sum() > 0
@@ -0,0 +1,93 @@
+# Tests of sending the report to a local SMTP server
+
+import email, os, smtplib, socket
+from email.policy import default
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from report_mail import write_report_message, write_html_report_message, send_report
+
+
+class Inbox:
+    """
+    Handler that keeps every message with its envelope and the session it came in.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session, envelope.mail_from, list(envelope.rcpt_tos), envelope.original_content))
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp():
+    with socket.socket() as free:
+        free.bind(("127.0.0.1", 0))
+        port = free.getsockname()[1]
+    inbox = Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        connection = smtplib.SMTP("127.0.0.1", port)
+        yield connection, inbox
+        connection.quit()
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def attachments(tmp_path):
+    paths = []
+    for i, size in enumerate([0, 1, 57 * 1024, 1500 * 1024 + 13]):
+        path = tmp_path / ("plot_" + str(i) + ".webp")
+        path.write_bytes(os.urandom(size))
+        paths.append(str(path))
+    return paths
+
+
+BODY = "Morgon\n.\n..två punkter\n.en punkt\nslut."
+
+
+def get_parts(content):
+    message = email.message_from_bytes(content, policy=default)
+    parts = [part for part in message.walk() if not part.is_multipart()]
+    return message, {part.get_filename(): part.get_payload(decode=True) for part in parts if part.get_filename()}, parts
+
+
+def test_attachments_and_body(smtp, attachments):
+    connection, inbox = smtp
+    with write_report_message("bot@example.com", "me@example.com", "Good morning", BODY, attachments) as message:
+        send_report(connection, "bot@example.com", "me@example.com", message)
+        message.seek(0)
+        sent = message.read()
+
+    (session, sender, recipients, content), = inbox.messages
+    assert sender == "bot@example.com" and recipients == ["me@example.com"]
+    # Every line ends with CRLF, and the server undid the dot-stuffing
+    assert content.count(b"\n") == content.count(b"\r\n")
+    assert content.replace(b"\r\n", b"\n") == sent
+    message, files, parts = get_parts(content)
+    assert message["Subject"] == "Good morning"
+    assert parts[-1].get_content().rstrip("\n") == BODY
+    assert files == {os.path.basename(path): open(path, "rb").read() for path in attachments}
+
+
+def test_several_recipients_on_one_connection(smtp, attachments):
+    connection, inbox = smtp
+    with write_report_message("bot@example.com", "me@example.com", "Good morning", BODY, attachments[:2]) as first, \
+         write_html_report_message("bot@example.com", ["a@example.com", "b@example.com"], "Good morning", BODY, \
+                                   attachments[2:]) as second:
+        send_report(connection, "bot@example.com", "me@example.com", first)
+        send_report(connection, "bot@example.com", ["a@example.com", "b@example.com"], second)
+        send_report(connection, "bot@example.com", ["c@example.com"], first)
+
+    assert [recipients for _, _, recipients, _ in inbox.messages] == \
+           [["me@example.com"], ["a@example.com", "b@example.com"], ["c@example.com"]]
+    assert len({id(session) for session, _, _, _ in inbox.messages}) == 1
+    assert inbox.messages[0][3] == inbox.messages[2][3]
+    message, files, parts = get_parts(inbox.messages[1][3])
+    assert BODY.replace("\n", "<br>") in parts[0].get_content()
+    assert files == {os.path.basename(path): open(path, "rb").read() for path in attachments[2:]}
@@ -0,0 +1,35 @@
+# Tests of the running statistics kept between runs
+
+import numpy as np
+import pandas as pd
+
+from report_functions import get_column_stats
+
+
+def get_data(rows=200, columns=4, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.integers(1, 6, (rows, columns)).astype(np.float32), columns=["M" + str(i) for i in range(columns)])
+    return data.mask(rng.random(data.shape) < 0.05)
+
+
+def test_added_rows(tmp_path):
+    stats_file = str(tmp_path / "stats.pkl")
+    data = get_data()
+    get_column_stats(data.iloc[:150], stats_file)
+    pd.testing.assert_frame_equal(get_column_stats(data, stats_file), get_column_stats(data))
+
+
+def test_edited_earlier_row(tmp_path):
+    stats_file = str(tmp_path / "stats.pkl")
+    data = get_data()
+    get_column_stats(data.iloc[:150], stats_file)
+    data.iloc[10, 2] = 5 if data.iloc[10, 2] != 5 else 1
+    pd.testing.assert_frame_equal(get_column_stats(data.iloc[:150], stats_file), get_column_stats(data.iloc[:150]))
+    pd.testing.assert_frame_equal(get_column_stats(data, stats_file), get_column_stats(data))
+
+
+def test_removed_rows(tmp_path):
+    stats_file = str(tmp_path / "stats.pkl")
+    data = get_data()
+    get_column_stats(data, stats_file)
+    pd.testing.assert_frame_equal(get_column_stats(data.iloc[:120], stats_file), get_column_stats(data.iloc[:120]))
@@ -0,0 +1,82 @@
+# Tests of the local sheet cache, against the fake worksheet of the benchmarks that the tests edit
+
+import pandas as pd
+import pytest
+
+from report_functions import get_journal_df
+from synthetic import FakeClient, get_sheet_rows
+
+
+@pytest.fixture(params=[(True, True), (False, True), (True, False)], ids=["drive", "no-drive", "read-only"])
+def journal(request, tmp_path):
+    rows = get_sheet_rows(1, gaps=0.05, future=5)
+    gc = FakeClient(rows, *request.param)
+
+    def sync():
+        return get_journal_df(None, None, "Journal", cache_path=str(tmp_path / "cache"), gc=gc)
+
+    sync()
+    return rows, gc.spreadsheet, sync
+
+
+def get_cells(spreadsheet):
+    return sum(sheet.cells for sheet in spreadsheet.worksheets())
+
+
+def check(spreadsheet, sync):
+    fresh = get_journal_df(None, None, "Journal", gc=FakeClient(spreadsheet.sheet1.rows))
+    pd.testing.assert_frame_equal(sync(), fresh)
+
+
+def test_unchanged(journal):
+    rows, spreadsheet, sync = journal
+    cells = get_cells(spreadsheet)
+    check(spreadsheet, sync)
+    if spreadsheet.drive:
+        assert get_cells(spreadsheet) == cells
+
+
+def test_append(journal):
+    rows, spreadsheet, sync = journal
+    spreadsheet.sheet1.edit(len(rows) - 5, "Journal", "ny dag")
+    spreadsheet.sheet1.edit(len(rows) - 5, "Sleep", "4")
+    cells = get_cells(spreadsheet)
+    check(spreadsheet, sync)
+    if spreadsheet.write:
+        # The checksums and the last rows, not the whole sheet
+        assert get_cells(spreadsheet) - cells < len(rows) * 2 + 100
+
+
+def test_prefilled_row(journal):
+    rows, spreadsheet, sync = journal
+    spreadsheet.sheet1.edit(len(rows) - 2, "Sleep", "3")
+    check(spreadsheet, sync)
+    spreadsheet.sheet1.edit(len(rows) - 2, "Journal", "skrev i förväg")
+    check(spreadsheet, sync)
+
+
+def test_edited_last_row(journal):
+    rows, spreadsheet, sync = journal
+    spreadsheet.sheet1.edit(len(rows) - 6, "Diet", "1" if rows["Diet"].iloc[-6] != 1 else "2")
+    check(spreadsheet, sync)
+
+
+def test_edited_earlier_row(journal):
+    rows, spreadsheet, sync = journal
+    spreadsheet.sheet1.edit(10, "Diet", "1" if rows["Diet"].iloc[10] != 1 else "2")
+    spreadsheet.sheet1.edit(11, "Journal", "ändrad")
+    check(spreadsheet, sync)
+
+
+def test_removed_rows(journal):
+    rows, spreadsheet, sync = journal
+    spreadsheet.sheet1.rows = spreadsheet.sheet1.rows.iloc[:100]
+    check(spreadsheet, sync)
+
+
+def test_checksum_worksheet(journal):
+    rows, spreadsheet, sync = journal
+    if spreadsheet.write:
+        assert spreadsheet.checksums.hidden and spreadsheet.checksums.title == "Journal checksums"
+    else:
+        assert spreadsheet.checksums is None